@@ -2,9 +2,29 @@ from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
+from contextlib import contextmanager
+from contextvars import ContextVar
 import uuid
 
 
+# Marca de tiempo compartida al crear modelos en lote (ver frozen_now)
+_frozen_now: ContextVar[Optional[datetime]] = ContextVar("frozen_now", default=None)
+
+
+def _now() -> datetime:
+    return _frozen_now.get() or datetime.utcnow()
+
+
+@contextmanager
+def frozen_now(now: Optional[datetime] = None):
+    """Usar una misma marca de tiempo para todos los modelos creados en el bloque"""
+    token = _frozen_now.set(now or datetime.utcnow())
+    try:
+        yield
+    finally:
+        _frozen_now.reset(token)
+
+
 class JobPortal(str, Enum):
     LINKEDIN = "linkedin"
     LABORUM = "laborum"
@@ -43,8 +63,8 @@ class UserProfile(BaseModel):
     phone: Optional[str] = None
     location: str = "Santiago, Chile"
     linkedin_url: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=_now)
+    updated_at: datetime = Field(default_factory=_now)
 
 
 class CVData(BaseModel):
@@ -58,10 +78,19 @@ class CVData(BaseModel):
     certifications: List[Dict[str, Any]]
     languages: List[Dict[str, Any]]
     raw_text: str  # Texto completo para IA
+    token_set: List[str] = []  # Palabras de raw_text para el análisis básico de compatibilidad
     file_path: Optional[str] = None
     is_default: bool = False
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=_now)
+    updated_at: datetime = Field(default_factory=_now)
+
+
+class CVSummary(BaseModel):
+    """Datos de CV para listados (sin el contenido completo)"""
+    id: str
+    title: str
+    is_default: bool = False
+    updated_at: datetime
 
 
 # Configuración de búsqueda
@@ -83,8 +112,8 @@ class SearchFilters(BaseModel):
     auto_apply: bool = True
     max_applications_per_day: int = 50
     is_active: bool = True
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=_now)
+    updated_at: datetime = Field(default_factory=_now)
 
 
 # Trabajo encontrado
@@ -107,8 +136,8 @@ class JobPosting(BaseModel):
     deadline: Optional[datetime] = None
     keywords_matched: List[str] = []
     match_percentage: Optional[float] = None
-    scraped_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    scraped_at: datetime = Field(default_factory=_now)
+    updated_at: datetime = Field(default_factory=_now)
 
 
 # Postulación
@@ -116,17 +145,20 @@ class JobApplication(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     job_id: str
+    portal: Optional[JobPortal] = None  # Copiado del trabajo para estadísticas
     cv_used: str  # ID del CV utilizado
     cover_letter: Optional[str] = None
     custom_message: Optional[str] = None
+    match_analysis: Optional[Dict[str, Any]] = None  # Resultado de analyze_job_compatibility
     portal_data: Dict[str, Any] = {}  # Datos específicos del portal
     status: ApplicationStatus = ApplicationStatus.PENDING
     applied_at: Optional[datetime] = None
-    last_update: datetime = Field(default_factory=datetime.utcnow)
+    last_update: datetime = Field(default_factory=_now)
     response_received: bool = False
     interview_scheduled: Optional[datetime] = None
     notes: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    claimed_at: Optional[datetime] = None  # Inicio del envío en curso (evita postular dos veces)
+    created_at: datetime = Field(default_factory=_now)
 
 
 # Estadísticas
@@ -153,8 +185,8 @@ class AIConfig(BaseModel):
     auto_form_fill: bool = True
     response_style: str = "professional"  # professional, friendly, formal
     cv_customization_level: str = "medium"  # low, medium, high
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=_now)
+    updated_at: datetime = Field(default_factory=_now)
 
 
 # Respuestas para crear
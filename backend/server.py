@@ -1,19 +1,26 @@
 from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse, Response
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from redis.asyncio import Redis
+from pymongo import ReturnDocument
 import os
+import asyncio
 import logging
 from pathlib import Path
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from typing import List, Optional, Type
 import aiofiles
 from datetime import datetime, timedelta
 import json
+import orjson
+from pydantic import BaseModel
 
 # Importar modelos
 from models import (
     UserProfile, UserProfileCreate,
-    CVData, CVDataCreate,
+    CVData, CVDataCreate, CVSummary,
     SearchFilters, SearchFiltersCreate,
     JobPosting, JobApplication, ApplicationStats,
     AIConfig, AIConfigCreate,
@@ -22,8 +29,11 @@ from models import (
 
 # Importar servicios
 from services.scraper_service import ScraperService
-from services.ai_service import AIService
-from services.application_service import ApplicationService
+from services.ai_service import AIService, extract_tokens
+from services.application_service import ApplicationService, APPLICATION_STATS_INDEX
+from services.cache_service import TTLCache
+from services.semantic_cache import SemanticCache
+from services.template_cache import TemplateCache
 
 
 ROOT_DIR = Path(__file__).parent
@@ -31,17 +41,66 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=100,
+    minPoolSize=10,
+    serverSelectionTimeoutMS=2000
+)
 db = client[os.environ['DB_NAME']]
 
+# Redis (opcional): configuraciones IA compartidas entre workers y reinicios
+redis_url = os.environ.get('REDIS_URL')
+redis_client = Redis.from_url(redis_url) if redis_url else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicializar y liberar los recursos compartidos de la app"""
+    # Falla rápido si Mongo no responde y deja el pool de conexiones abierto
+    await client.admin.command("ping")
+    await create_indexes()
+    await ai_service.cache.load()
+    await ai_service.template_cache.load()
+    scraper_service.session = ScraperService.create_session()
+    scraper_service.schedule_daily_reset()
+    start_apply_workers(app)
+    
+    yield
+    
+    await stop_apply_workers(app)
+    application_service.shutdown()
+    await scraper_service.close()
+    if redis_client is not None:
+        await redis_client.aclose()
+    client.close()
+
+
 # Create the main app
-app = FastAPI(title="Autopostulador Laboral Chile", version="1.0.0")
+app = FastAPI(
+    title="Autopostulador Laboral Chile",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 api_router = APIRouter(prefix="/api")
 
 # Servicios
-scraper_service = ScraperService()
-ai_service = AIService()
-application_service = ApplicationService(db)
+scraper_service = ScraperService(db)
+ai_service = AIService(
+    cache=SemanticCache(db, snapshot_dir=os.environ.get('SEMANTIC_CACHE_DIR')),
+    template_cache=TemplateCache(db),
+    config_store=redis_client,
+    db=db
+)
+application_service = ApplicationService(db, ai_service)
+
+# Cachés en memoria para lecturas frecuentes (clave: user_id)
+default_cv_cache = TTLCache(maxsize=10_000, ttl=60)
+ai_config_cache = TTLCache(maxsize=10_000, ttl=60)
+
+# Cola de postulaciones: número fijo de workers (el límite por portal lo aplica ApplicationService)
+APPLY_WORKERS = int(os.environ.get('APPLY_WORKERS', '5'))
 
 
 # Middleware
@@ -61,13 +120,47 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# Índices usados por las estadísticas (se fuerzan con hint)
+APPLICATIONS_BY_DATE_INDEX = APPLICATION_STATS_INDEX  # También lo usa ApplicationService
+JOBS_BY_DATE_INDEX = [("scraped_at", -1)]
+
+# Proyecciones: excluir el _id interno de Mongo, que no forma parte de los modelos
+DEFAULT_PROJECTION = {"_id": 0}
+CV_SUMMARY_PROJECTION = {"_id": 0, "id": 1, "title": 1, "is_default": 1, "updated_at": 1}
+
+
+def stream_documents(cursor, model: Type[BaseModel]) -> StreamingResponse:
+    """Transmitir un cursor como arreglo JSON, un documento a la vez.
+    
+    Cada documento se valida con el modelo: los trabajos scrapeados se guardan
+    sin validar (model_construct) y un documento mal formado no debe salir tal cual.
+    """
+    async def generate():
+        yield b"["
+        first = True
+        async for doc in cursor:
+            if not first:
+                yield b","
+            first = False
+            yield orjson.dumps(model.model_validate(doc).model_dump())
+        yield b"]"
+    
+    return StreamingResponse(generate(), media_type="application/json")
+
+
+async def insert_document(collection, doc: dict) -> ORJSONResponse:
+    """Insertar documento y devolverlo tal cual, sin volver a pasar por el modelo"""
+    await collection.insert_one(doc)
+    doc.pop("_id", None)  # insert_one agrega el ObjectId al diccionario
+    return ORJSONResponse(doc)
+
+
 # ====================== USUARIO ======================
 @api_router.post("/user", response_model=UserProfile)
 async def create_user(user_data: UserProfileCreate):
     """Crear perfil de usuario"""
-    user = UserProfile(**user_data.dict())
-    result = await db.users.insert_one(user.dict())
-    return user
+    user = UserProfile(**user_data.model_dump())
+    return await insert_document(db.users, user.model_dump())
 
 
 @api_router.get("/user/{user_id}", response_model=UserProfile)
@@ -76,32 +169,33 @@ async def get_user(user_id: str):
     user = await db.users.find_one({"id": user_id})
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    return UserProfile(**user)
+    return UserProfile.model_validate(user)
 
 
 @api_router.put("/user/{user_id}", response_model=UserProfile)
 async def update_user(user_id: str, user_data: UserProfileCreate):
     """Actualizar perfil de usuario"""
-    updated_data = user_data.dict()
-    updated_data["updated_at"] = datetime.utcnow()
-    
-    result = await db.users.update_one(
-        {"id": user_id}, 
-        {"$set": updated_data}
+    updated_user = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$set": user_data.model_dump(), "$currentDate": {"updated_at": True}},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
+    if not updated_user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    updated_user = await db.users.find_one({"id": user_id})
-    return UserProfile(**updated_user)
+    return UserProfile.model_validate(updated_user)
 
 
 # ====================== CV ======================
 @api_router.post("/user/{user_id}/cv", response_model=CVData)
 async def create_cv(user_id: str, cv_data: CVDataCreate):
     """Crear CV para usuario"""
-    cv = CVData(**cv_data.dict(), user_id=user_id)
+    cv = CVData(
+        **cv_data.model_dump(),
+        user_id=user_id,
+        token_set=sorted(extract_tokens(cv_data.raw_text))
+    )
     
     # Si es el CV por defecto, desmarcar otros CVs
     if cv.is_default:
@@ -109,16 +203,16 @@ async def create_cv(user_id: str, cv_data: CVDataCreate):
             {"user_id": user_id}, 
             {"$set": {"is_default": False}}
         )
+        default_cv_cache.invalidate(user_id)
     
-    await db.cvs.insert_one(cv.dict())
-    return cv
+    return await insert_document(db.cvs, cv.model_dump())
 
 
-@api_router.get("/user/{user_id}/cvs", response_model=List[CVData])
+@api_router.get("/user/{user_id}/cvs", response_model=List[CVSummary])
 async def get_user_cvs(user_id: str):
-    """Obtener todos los CVs del usuario"""
-    cvs = await db.cvs.find({"user_id": user_id}).to_list(100)
-    return [CVData(**cv) for cv in cvs]
+    """Obtener resumen de los CVs del usuario (el detalle está en /cv/{cv_id})"""
+    cursor = db.cvs.find({"user_id": user_id}, CV_SUMMARY_PROJECTION).limit(100)
+    return stream_documents(cursor, CVSummary)
 
 
 @api_router.get("/cv/{cv_id}", response_model=CVData)
@@ -127,33 +221,35 @@ async def get_cv(cv_id: str):
     cv = await db.cvs.find_one({"id": cv_id})
     if not cv:
         raise HTTPException(status_code=404, detail="CV no encontrado")
-    return CVData(**cv)
+    return CVData.model_validate(cv)
 
 
 @api_router.put("/cv/{cv_id}", response_model=CVData)
 async def update_cv(cv_id: str, cv_data: CVDataCreate):
     """Actualizar CV"""
-    updated_data = cv_data.dict()
-    updated_data["updated_at"] = datetime.utcnow()
-    
-    result = await db.cvs.update_one(
-        {"id": cv_id}, 
-        {"$set": updated_data}
+    updated_cv = await db.cvs.find_one_and_update(
+        {"id": cv_id},
+        {
+            "$set": {**cv_data.model_dump(), "token_set": sorted(extract_tokens(cv_data.raw_text))},
+            "$currentDate": {"updated_at": True}
+        },
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
+    if not updated_cv:
         raise HTTPException(status_code=404, detail="CV no encontrado")
     
-    updated_cv = await db.cvs.find_one({"id": cv_id})
-    return CVData(**updated_cv)
+    default_cv_cache.invalidate(updated_cv["user_id"])
+    return CVData.model_validate(updated_cv)
 
 
 @api_router.delete("/cv/{cv_id}")
 async def delete_cv(cv_id: str):
     """Eliminar CV"""
-    result = await db.cvs.delete_one({"id": cv_id})
-    if result.deleted_count == 0:
+    deleted_cv = await db.cvs.find_one_and_delete({"id": cv_id}, {"user_id": 1})
+    if not deleted_cv:
         raise HTTPException(status_code=404, detail="CV no encontrado")
+    default_cv_cache.invalidate(deleted_cv["user_id"])
     return {"message": "CV eliminado exitosamente"}
 
 
@@ -161,34 +257,30 @@ async def delete_cv(cv_id: str):
 @api_router.post("/user/{user_id}/search-filters", response_model=SearchFilters)
 async def create_search_filters(user_id: str, filters_data: SearchFiltersCreate):
     """Crear filtros de búsqueda"""
-    filters = SearchFilters(**filters_data.dict(), user_id=user_id)
-    await db.search_filters.insert_one(filters.dict())
-    return filters
+    filters = SearchFilters(**filters_data.model_dump(), user_id=user_id)
+    return await insert_document(db.search_filters, filters.model_dump())
 
 
 @api_router.get("/user/{user_id}/search-filters", response_model=List[SearchFilters])
 async def get_user_search_filters(user_id: str):
     """Obtener filtros de búsqueda del usuario"""
-    filters = await db.search_filters.find({"user_id": user_id}).to_list(100)
-    return [SearchFilters(**f) for f in filters]
+    cursor = db.search_filters.find({"user_id": user_id}, DEFAULT_PROJECTION).limit(100)
+    return stream_documents(cursor, SearchFilters)
 
 
 @api_router.put("/search-filters/{filter_id}", response_model=SearchFilters)
 async def update_search_filters(filter_id: str, filters_data: SearchFiltersCreate):
     """Actualizar filtros de búsqueda"""
-    updated_data = filters_data.dict()
-    updated_data["updated_at"] = datetime.utcnow()
-    
-    result = await db.search_filters.update_one(
-        {"id": filter_id}, 
-        {"$set": updated_data}
+    updated_filters = await db.search_filters.find_one_and_update(
+        {"id": filter_id},
+        {"$set": filters_data.model_dump(), "$currentDate": {"updated_at": True}},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
+    if not updated_filters:
         raise HTTPException(status_code=404, detail="Filtros no encontrados")
     
-    updated_filters = await db.search_filters.find_one({"id": filter_id})
-    return SearchFilters(**updated_filters)
+    return SearchFilters.model_validate(updated_filters)
 
 
 # ====================== TRABAJOS ======================
@@ -204,8 +296,8 @@ async def get_user_jobs(
     if portal:
         query["portal"] = portal
     
-    jobs = await db.jobs.find(query).skip(skip).limit(limit).to_list(limit)
-    return [JobPosting(**job) for job in jobs]
+    cursor = db.jobs.find(query, DEFAULT_PROJECTION).sort("scraped_at", -1).skip(skip).limit(limit)
+    return stream_documents(cursor, JobPosting)
 
 
 @api_router.get("/job/{job_id}", response_model=JobPosting)
@@ -214,7 +306,7 @@ async def get_job(job_id: str):
     job = await db.jobs.find_one({"id": job_id})
     if not job:
         raise HTTPException(status_code=404, detail="Trabajo no encontrado")
-    return JobPosting(**job)
+    return JobPosting.model_validate(job)
 
 
 # ====================== POSTULACIONES ======================
@@ -230,15 +322,14 @@ async def get_user_applications(
     if status:
         query["status"] = status
     
-    applications = await db.applications.find(query).skip(skip).limit(limit).to_list(limit)
-    return [JobApplication(**app) for app in applications]
+    cursor = db.applications.find(query, DEFAULT_PROJECTION).sort("created_at", -1).skip(skip).limit(limit)
+    return stream_documents(cursor, JobApplication)
 
 
 @api_router.post("/user/{user_id}/apply/{job_id}")
 async def apply_to_job(
     user_id: str, 
     job_id: str,
-    background_tasks: BackgroundTasks,
     cv_id: Optional[str] = None,
     custom_message: Optional[str] = None
 ):
@@ -250,31 +341,50 @@ async def apply_to_job(
     
     # Usar CV por defecto si no se especifica
     if not cv_id:
-        cv = await db.cvs.find_one({"user_id": user_id, "is_default": True})
+        cv_id = default_cv_cache.get(user_id)
+    if not cv_id:
+        cv = await db.cvs.find_one({"user_id": user_id, "is_default": True}, {"id": 1})
         if not cv:
             raise HTTPException(status_code=400, detail="No hay CV por defecto configurado")
         cv_id = cv["id"]
+        default_cv_cache.set(user_id, cv_id)
     
     # Crear postulación
     application = JobApplication(
         user_id=user_id,
         job_id=job_id,
+        portal=job["portal"],
         cv_used=cv_id,
         custom_message=custom_message,
         status=ApplicationStatus.PENDING
     )
     
-    await db.applications.insert_one(application.dict())
+    await db.applications.insert_one(application.model_dump())
     
-    # Procesar postulación en background
-    background_tasks.add_task(
-        application_service.process_application,
-        application.id
-    )
+    # Encolar postulación para procesarla en background
+    await app.state.apply_queue.put(application.id)
     
     return {"message": "Postulación iniciada", "application_id": application.id}
 
 
+@api_router.post("/user/{user_id}/applications/process-pending")
+async def process_pending_applications(user_id: str, background_tasks: BackgroundTasks):
+    """Reprocesar en lote las postulaciones pendientes (p. ej. tras reiniciar el servidor).
+    
+    Las que siguen en la cola o en proceso se omiten: cada postulación se toma
+    de forma atómica antes de enviarse.
+    """
+    pending = await db.applications.find(
+        {"user_id": user_id, "status": ApplicationStatus.PENDING.value},
+        {"_id": 0, "id": 1}
+    ).to_list(500)
+    application_ids = [app["id"] for app in pending]
+    
+    background_tasks.add_task(application_service.process_batch, application_ids)
+    
+    return {"message": "Procesamiento en lote iniciado", "count": len(application_ids)}
+
+
 # ====================== BÚSQUEDA AUTOMÁTICA ======================
 @api_router.post("/user/{user_id}/start-search")
 async def start_automatic_search(user_id: str, background_tasks: BackgroundTasks):
@@ -316,27 +426,36 @@ async def stop_automatic_search(user_id: str):
 @api_router.post("/user/{user_id}/ai-config", response_model=AIConfig)
 async def create_ai_config(user_id: str, config_data: AIConfigCreate):
     """Configurar IA para el usuario"""
-    config = AIConfig(**config_data.dict(), user_id=user_id)
+    config = AIConfig(**config_data.model_dump(), user_id=user_id)
     
     # Eliminar configuración anterior si existe
     await db.ai_config.delete_many({"user_id": user_id})
     
-    await db.ai_config.insert_one(config.dict())
+    config_doc = config.model_dump()
+    response = await insert_document(db.ai_config, config_doc)
+    ai_config_cache.set(user_id, config)
     
     # Actualizar servicio AI con nueva configuración
     if config.gemini_api_key:
-        ai_service.update_config(user_id, config.dict())
+        await ai_service.update_config(user_id, config_doc)
     
-    return config
+    return response
 
 
 @api_router.get("/user/{user_id}/ai-config", response_model=AIConfig)
 async def get_ai_config(user_id: str):
     """Obtener configuración IA del usuario"""
+    cached_config = ai_config_cache.get(user_id)
+    if cached_config:
+        return cached_config
+    
     config = await db.ai_config.find_one({"user_id": user_id})
     if not config:
         raise HTTPException(status_code=404, detail="Configuración IA no encontrada")
-    return AIConfig(**config)
+    
+    ai_config = AIConfig.model_validate(config)
+    ai_config_cache.set(user_id, ai_config)
+    return ai_config
 
 
 # ====================== ESTADÍSTICAS ======================
@@ -345,36 +464,32 @@ async def get_user_stats(user_id: str, days: int = 30):
     """Obtener estadísticas del usuario"""
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    # Estadísticas básicas
-    total_applications = await db.applications.count_documents({
-        "user_id": user_id,
-        "created_at": {"$gte": start_date}
-    })
-    
-    total_jobs_found = await db.jobs.count_documents({
-        "scraped_at": {"$gte": start_date}
-    })
-    
-    # Aplicaciones por estado
+    # Conteos, estados y portales de postulaciones en una sola agregación
     pipeline = [
         {"$match": {"user_id": user_id, "created_at": {"$gte": start_date}}},
-        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-    ]
-    status_stats = await db.applications.aggregate(pipeline).to_list(10)
-    
-    # Aplicaciones por portal
-    portal_pipeline = [
-        {"$lookup": {
-            "from": "jobs",
-            "localField": "job_id",
-            "foreignField": "id",
-            "as": "job_info"
-        }},
-        {"$unwind": "$job_info"},
-        {"$match": {"user_id": user_id, "created_at": {"$gte": start_date}}},
-        {"$group": {"_id": "$job_info.portal", "count": {"$sum": 1}}}
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "by_portal": [
+                {"$match": {"portal": {"$ne": None}}},
+                {"$group": {"_id": "$portal", "count": {"$sum": 1}}}
+            ]
+        }}
     ]
-    portal_stats = await db.applications.aggregate(portal_pipeline).to_list(10)
+    
+    # Consultas independientes: ejecutarlas en paralelo
+    facets, total_jobs_found = await asyncio.gather(
+        db.applications.aggregate(pipeline, hint=APPLICATIONS_BY_DATE_INDEX).to_list(1),
+        db.jobs.count_documents(
+            {"scraped_at": {"$gte": start_date}},
+            hint=JOBS_BY_DATE_INDEX
+        )
+    )
+    
+    facet = facets[0]
+    total_applications = facet["total"][0]["n"] if facet["total"] else 0
+    status_stats = facet["by_status"]
+    portal_stats = facet["by_portal"]
     
     return {
         "period_days": days,
@@ -387,25 +502,67 @@ async def get_user_stats(user_id: str, days: int = 30):
 
 
 # ====================== HEALTH CHECK ======================
+# Respuestas fijas, codificadas una sola vez
+HEALTH_BODY = orjson.dumps({"status": "healthy", "version": "1.0.0"})
+ROOT_BODY = orjson.dumps({"message": "Autopostulador Laboral Chile API - ¡Sistema funcionando!"})
+HEALTH_HEADERS = {"Cache-Control": "public, max-age=5"}
+
+
 @api_router.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "timestamp": datetime.utcnow(),
-        "version": "1.0.0"
-    }
+    return Response(HEALTH_BODY, headers=HEALTH_HEADERS, media_type="application/json")
 
 
 @api_router.get("/")
 async def root():
-    return {"message": "Autopostulador Laboral Chile API - ¡Sistema funcionando!"}
+    return Response(ROOT_BODY, media_type="application/json")
 
 
 # Include router
 app.include_router(api_router)
 
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def create_indexes():
+    """Crear índices para las consultas más frecuentes (único lugar donde se definen)"""
+    # Búsquedas por id (UUID en string) de cada colección
+    for collection in (db.users, db.cvs, db.search_filters, db.jobs, db.applications, db.ai_config):
+        await collection.create_index("id", unique=True)
+    
+    await db.cvs.create_index([("user_id", 1), ("is_default", -1)])
+    await db.applications.create_index([("user_id", 1), ("status", 1), ("created_at", -1)])
+    await db.applications.create_index([("user_id", 1), ("portal", 1), ("created_at", -1)])
+    await db.applications.create_index(APPLICATIONS_BY_DATE_INDEX)
+    await db.jobs.create_index([("portal", 1), ("scraped_at", -1)])
+    await db.jobs.create_index(JOBS_BY_DATE_INDEX)
+    await db.jobs.create_index([("portal", 1), ("external_id", 1)], unique=True)
+    await db.search_filters.create_index([("user_id", 1), ("is_active", 1)])
+    await db.ai_config.create_index("user_id", unique=True)
+
+
+async def apply_worker(queue: asyncio.Queue):
+    """Procesar postulaciones encoladas"""
+    while True:
+        application_id = await queue.get()
+        try:
+            await application_service.process_application(application_id)
+        except Exception as e:
+            logger.error(f"Error en worker de postulaciones ({application_id}): {e}")
+        finally:
+            queue.task_done()
+
+
+def start_apply_workers(app: FastAPI):
+    """Iniciar workers de la cola de postulaciones"""
+    app.state.apply_queue = asyncio.Queue()
+    app.state.apply_workers = [
+        asyncio.create_task(apply_worker(app.state.apply_queue))
+        for _ in range(APPLY_WORKERS)
+    ]
+
+
+async def stop_apply_workers(app: FastAPI):
+    """Detener workers de la cola de postulaciones"""
+    for worker in app.state.apply_workers:
+        worker.cancel()
+    await asyncio.gather(*app.state.apply_workers, return_exceptions=True)
\ No newline at end of file
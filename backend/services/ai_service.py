@@ -1,47 +1,94 @@
 import os
+import re
+import json
+import math
 import logging
+import orjson
+from functools import lru_cache
 from typing import Dict, List, Optional, Any
 from emergentintegrations.llm.chat import LlmChat, UserMessage
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import CVData, JobPosting
+from redis.asyncio import Redis
+from services.cache_service import TTLCache
+from services.semantic_cache import SemanticCache
+from services.template_cache import TemplateCache
 
 logger = logging.getLogger(__name__)
 
+CONFIG_KEY_PREFIX = "aicfg:"
 
-class AIService:
-    def __init__(self):
-        self.user_configs: Dict[str, Dict] = {}
-        self.active_chats: Dict[str, LlmChat] = {}
-    
-    def update_config(self, user_id: str, config: Dict):
-        """Actualizar configuración AI para un usuario"""
-        self.user_configs[user_id] = config
-        
-        # Crear nueva instancia de chat si hay API key
-        if config.get("gemini_api_key"):
-            try:
-                chat = LlmChat(
-                    api_key=config["gemini_api_key"],
-                    session_id=f"user_{user_id}",
-                    system_message=self._get_system_message(config)
-                ).with_model("gemini", "gemini-2.0-flash")
-                
-                self.active_chats[user_id] = chat
-                logger.info(f"AI configurado para usuario {user_id}")
-            except Exception as e:
-                logger.error(f"Error configurando AI para {user_id}: {e}")
+# Presupuesto de caracteres por sección del prompt (~4 caracteres por token)
+MAX_CV_CHARS = 8000
+MAX_SECTION_CHARS = 3000
+MAX_DESCRIPTION_CHARS = 1500
+MAX_REQUIREMENTS_CHARS = 1000
+
+
+def truncate(text: str, max_chars: int) -> str:
+    """Recortar texto al presupuesto, sin cortar la última palabra"""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + "..."
+
+
+def job_prompt_fields(job_posting: JobPosting) -> Dict[str, str]:
+    """Descripción y requisitos de la oferta recortados para el prompt"""
+    return {
+        "description": truncate(job_posting.description, MAX_DESCRIPTION_CHARS),
+        "requirements": truncate(", ".join(job_posting.requirements), MAX_REQUIREMENTS_CHARS)
+    }
+
+
+TOKEN_PATTERN = re.compile(r"\w{3,}")
+NUMBERED_ANSWER_PATTERN = re.compile(r"^\s*(\d+)[.)]\s*(.+)$", re.M)
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.S)
+ANALYSIS_FIELD_PATTERN = re.compile(
+    r"^[\s*#-]*(COMPATIBILIDAD|FORTALEZAS|DEBILIDADES|RECOMENDACION)\**:\**\s*(.+?)\s*$", re.M
+)
+PERCENTAGE_PATTERN = re.compile(r"\d+")
+
+
+def _split_items(value: str) -> List[str]:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+# Campo de la respuesta de análisis -> (clave del resultado, conversión del valor)
+ANALYSIS_FIELDS = {
+    "COMPATIBILIDAD": ("compatibility_percentage", lambda value: int(PERCENTAGE_PATTERN.search(value).group(0))),
+    "FORTALEZAS": ("strengths", _split_items),
+    "DEBILIDADES": ("weaknesses", _split_items),
+    "RECOMENDACION": ("recommendation", str)
+}
+
+# Palabras frecuentes en español que no aportan al análisis de compatibilidad
+STOPWORDS_ES = frozenset("""
+    los las del por para con una uno unos unas que como más pero sus este esta estos estas ese esa
+    esos esas son ser fue han hay muy sin sobre entre cuando donde desde hasta también todo toda
+    todos todas otro otra otros otras año años nos les ella ellos ellas está están estar tiene
+    tener cada porque según durante mediante bajo tras ante hacia dentro fuera así bien nuestra
+    nuestro nuestros nuestras empresa trabajo cargo experiencia
+""".split())
+
+
+def extract_tokens(text: str) -> frozenset:
+    """Palabras significativas (3+ caracteres, sin stopwords) de un texto"""
+    return frozenset(w for w in TOKEN_PATTERN.findall(text.lower()) if w not in STOPWORDS_ES)
+
+
+RESPONSE_TONES = {
+    "professional": "Usa un tono profesional y directo, enfocado en logros y resultados cuantificables.",
+    "friendly": "Usa un tono amigable pero profesional, mostrando entusiasmo y personalidad.",
+    "formal": "Usa un tono muy formal y conservador, con lenguaje corporativo tradicional."
+}
+
+
+@lru_cache(maxsize=8)
+def build_system_message(style: str) -> str:
+    """Mensaje del sistema para un estilo de respuesta (se construye una vez por estilo)"""
+    tone = RESPONSE_TONES.get(style, RESPONSE_TONES["formal"])
     
-    def _get_system_message(self, config: Dict) -> str:
-        """Generar mensaje del sistema basado en configuración"""
-        style = config.get("response_style", "professional")
-        
-        if style == "professional":
-            tone = "Usa un tono profesional y directo, enfocado en logros y resultados cuantificables."
-        elif style == "friendly":
-            tone = "Usa un tono amigable pero profesional, mostrando entusiasmo y personalidad."
-        else:  # formal
-            tone = "Usa un tono muy formal y conservador, con lenguaje corporativo tradicional."
-        
-        return f"""Eres un especialista en recursos humanos y redacción de documentos laborales para el mercado chileno.
+    return f"""Eres un especialista en recursos humanos y redacción de documentos laborales para el mercado chileno.
 
 Tu trabajo es:
 1. Personalizar CVs y cartas de presentación para ofertas laborales específicas en Chile
@@ -62,28 +109,152 @@ Cuando personalices documentos, enfócate en:
 - Mostrar valor agregado y resultados concretos
 - Mantener coherencia con el perfil profesional del candidato"""
 
+
+class AIService:
+    def __init__(self, cache: Optional[SemanticCache] = None, template_cache: Optional[TemplateCache] = None,
+                 config_store: Optional[Redis] = None, db: Optional[AsyncIOMotorDatabase] = None):
+        # Copia reciente de las configuraciones (Redis y Mongo son la fuente); sin ellos no expira
+        self.user_configs = TTLCache(maxsize=10_000, ttl=60 if config_store is not None or db is not None else math.inf)
+        self.config_collection = db.ai_config if db is not None else None
+        # Chats construidos en este worker, junto con la configuración que los generó
+        self.active_chats = TTLCache(maxsize=10_000, ttl=3600)
+        self.cache = cache
+        self.template_cache = template_cache
+        self.config_store = config_store
+        # Análisis básico por (CV, versión del CV, oferta): es determinista
+        self._basic_analysis_cache = TTLCache(maxsize=2048, ttl=3600)
+    
+    async def update_config(self, user_id: str, config: Dict):
+        """Actualizar configuración AI para un usuario"""
+        self.user_configs.set(user_id, config)
+        self.active_chats.invalidate(user_id)
+        
+        if self.config_store is not None:
+            try:
+                await self.config_store.set(f"{CONFIG_KEY_PREFIX}{user_id}", orjson.dumps(config))
+            except Exception as e:
+                logger.warning(f"No se pudo guardar configuración AI en Redis: {e}")
+        
+        if await self._get_chat(user_id) is not None:
+            logger.info(f"AI configurado para usuario {user_id}")
+    
+    async def _get_config(self, user_id: str) -> Optional[Dict]:
+        """Configuración del usuario desde la copia local, Redis o Mongo"""
+        config = self.user_configs.get(user_id)
+        if config is not None:
+            return config
+        
+        if self.config_store is not None:
+            try:
+                raw = await self.config_store.get(f"{CONFIG_KEY_PREFIX}{user_id}")
+                if raw:
+                    config = orjson.loads(raw)
+            except Exception as e:
+                logger.warning(f"No se pudo leer configuración AI desde Redis: {e}")
+        
+        if config is None and self.config_collection is not None:
+            config = await self.config_collection.find_one({"user_id": user_id}, {"_id": 0}) or {}
+            # Repoblar Redis tras un reinicio o flush
+            if config and self.config_store is not None:
+                try:
+                    await self.config_store.set(f"{CONFIG_KEY_PREFIX}{user_id}", orjson.dumps(config))
+                except Exception as e:
+                    logger.warning(f"No se pudo guardar configuración AI en Redis: {e}")
+        
+        if config is not None:
+            self.user_configs.set(user_id, config)
+        return config
+    
+    async def _get_chat(self, user_id: str) -> Optional[LlmChat]:
+        """Chat del usuario, construido la primera vez que se usa en este worker"""
+        config = await self._get_config(user_id)
+        if not config or not config.get("gemini_api_key"):
+            return None
+        
+        fingerprint = (config["gemini_api_key"], config.get("response_style", "professional"))
+        entry = self.active_chats.get(user_id)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+        
+        try:
+            chat = LlmChat(
+                api_key=config["gemini_api_key"],
+                session_id=f"user_{user_id}",
+                system_message=self._get_system_message(config)
+            ).with_model("gemini", "gemini-2.0-flash")
+        except Exception as e:
+            logger.error(f"Error configurando AI para {user_id}: {e}")
+            return None
+        
+        self.active_chats.set(user_id, (fingerprint, chat))
+        return chat
+    
+    def _get_system_message(self, config: Dict) -> str:
+        """Generar mensaje del sistema basado en configuración"""
+        return build_system_message(config.get("response_style", "professional"))
+
+    def _cache_namespace(self, kind: str, user_id: str, cv_data: CVData, *extra: str) -> str:
+        """Namespace exacto de caché: nunca se comparten respuestas entre usuarios, CVs o estilos"""
+        style = (self.user_configs.get(user_id) or {}).get("response_style", "professional")
+        parts = [kind, user_id, cv_data.id, cv_data.updated_at.isoformat(), style, *extra]
+        return ":".join(parts)
+    
+    async def _send(self, chat: LlmChat, prompt: str, namespace: Optional[str] = None,
+                    key_text: Optional[str] = None, threshold: Optional[float] = None) -> str:
+        """Enviar prompt al LLM, reutilizando la respuesta de un prompt similar si existe"""
+        message = UserMessage(text=prompt)
+        if self.cache is None or namespace is None:
+            return await chat.send_message(message)
+        
+        response, hit = await self.cache.get_or_compute(
+            namespace, key_text, lambda: chat.send_message(message), threshold=threshold
+        )
+        if hit:
+            logger.info(f"Respuesta LLM obtenida desde caché ({namespace.split(':', 1)[0]})")
+        return response
+    
+    async def _generate_for_job(self, kind: str, user_id: str, cv_data: CVData, job_posting: JobPosting,
+                                chat: LlmChat, prompt: str, key_text: str) -> str:
+        """Generar texto para una oferta pasando por la caché de plantillas y la semántica"""
+        # El cargo va en el namespace: ofertas de la misma empresa con otro cargo no comparten respuesta
+        title = " ".join(job_posting.title.lower().split())
+        namespace = self._cache_namespace(kind, user_id, cv_data, job_posting.company.lower(), title)
+        slots = {"company": job_posting.company, "title": job_posting.title}
+        
+        if self.template_cache is not None:
+            cached = await self.template_cache.get(namespace, slots)
+            if cached is not None:
+                logger.info(f"Respuesta LLM obtenida desde caché de plantillas ({kind})")
+                return cached
+        
+        response = await self._send(chat, prompt, namespace=namespace, key_text=key_text)
+        
+        if self.template_cache is not None:
+            await self.template_cache.put(namespace, slots, response)
+        return response
+    
     async def personalize_cv(self, user_id: str, cv_data: CVData, job_posting: JobPosting) -> str:
         """Personalizar CV para una oferta específica"""
-        if user_id not in self.active_chats:
+        chat = await self._get_chat(user_id)
+        if chat is None:
             logger.warning(f"No hay configuración AI para usuario {user_id}")
             return cv_data.raw_text
         
         try:
-            chat = self.active_chats[user_id]
-            
+            job = job_prompt_fields(job_posting)
             prompt = f"""Necesito personalizar este CV para una oferta laboral específica.
 
 DATOS DEL CV:
 Nombre: {cv_data.personal_info.get('name', 'N/A')}
-Experiencia: {cv_data.experience}
-Habilidades: {cv_data.skills}
-Educación: {cv_data.education}
+Experiencia: {truncate(str(cv_data.experience), MAX_SECTION_CHARS)}
+Habilidades: {truncate(", ".join(cv_data.skills), MAX_SECTION_CHARS)}
+Educación: {truncate(str(cv_data.education), MAX_SECTION_CHARS)}
 
 OFERTA LABORAL:
 Empresa: {job_posting.company}
 Cargo: {job_posting.title}
-Descripción: {job_posting.description}
-Requisitos: {job_posting.requirements}
+Descripción: {job["description"]}
+Requisitos: {job["requirements"]}
 
 INSTRUCCIONES:
 1. Adapta el CV resaltando la experiencia más relevante para este cargo
@@ -94,8 +265,10 @@ INSTRUCCIONES:
 
 CV PERSONALIZADO:"""
 
-            message = UserMessage(text=prompt)
-            response = await chat.send_message(message)
+            response = await self._generate_for_job(
+                "personalize_cv", user_id, cv_data, job_posting, chat, prompt,
+                key_text=f"{job_posting.title}\n{job['requirements']}\n{job['description']}"
+            )
             
             logger.info(f"CV personalizado generado para usuario {user_id}, trabajo {job_posting.title}")
             return response
@@ -104,16 +277,9 @@ CV PERSONALIZADO:"""
             logger.error(f"Error personalizando CV: {e}")
             return cv_data.raw_text
     
-    async def generate_cover_letter(self, user_id: str, cv_data: CVData, job_posting: JobPosting) -> str:
-        """Generar carta de presentación personalizada"""
-        if user_id not in self.active_chats:
-            logger.warning(f"No hay configuración AI para usuario {user_id}")
-            return f"Estimados Sres. de {job_posting.company}, adjunto mi CV para el cargo de {job_posting.title}. Saludos cordiales."
-        
-        try:
-            chat = self.active_chats[user_id]
-            
-            prompt = f"""Genera una carta de presentación para esta postulación laboral.
+    @staticmethod
+    def _cover_letter_prompt(cv_data: CVData, job_posting: JobPosting) -> str:
+        return f"""Genera una carta de presentación para esta postulación laboral.
 
 DATOS DEL CANDIDATO:
 Nombre: {cv_data.personal_info.get('name', 'N/A')}
@@ -134,30 +300,48 @@ INSTRUCCIONES:
 6. No uses "A quien corresponda" - dirígete a la empresa específica
 
 CARTA DE PRESENTACIÓN:"""
-
-            message = UserMessage(text=prompt)
-            response = await chat.send_message(message)
+    
+    @staticmethod
+    def _cover_letter_key(job_posting: JobPosting) -> str:
+        return f"{job_posting.title}\n{job_posting.requirements}\n{job_posting.description[:500]}"
+    
+    async def generate_cover_letter(self, user_id: str, cv_data: CVData, job_posting: JobPosting) -> str:
+        """Generar carta de presentación personalizada"""
+        chat = await self._get_chat(user_id)
+        if chat is None:
+            logger.warning(f"No hay configuración AI para usuario {user_id}")
+            return f"Estimados Sres. de {job_posting.company}, adjunto mi CV para el cargo de {job_posting.title}. Saludos cordiales."
+        
+        try:
+            response = await self._generate_for_job(
+                "cover_letter", user_id, cv_data, job_posting, chat,
+                self._cover_letter_prompt(cv_data, job_posting),
+                key_text=self._cover_letter_key(job_posting)
+            )
             
             logger.info(f"Carta generada para usuario {user_id}, trabajo {job_posting.title}")
             return response
             
         except Exception as e:
             logger.error(f"Error generando carta: {e}")
-            return f"Estimados Sres. de {job_posting.company},\n\nTengo gran interés en el cargo de {job_posting.title}. Mi experiencia profesional me permite contribuir efectivamente al equipo. Adjunto mi CV para su revisión.\n\nSaludos cordiales,\n{cv_data.personal_info.get('name', '')}"
+            return self._cover_letter_fallback(cv_data, job_posting)
+    
+    @staticmethod
+    def _cover_letter_fallback(cv_data: CVData, job_posting: JobPosting) -> str:
+        return f"Estimados Sres. de {job_posting.company},\n\nTengo gran interés en el cargo de {job_posting.title}. Mi experiencia profesional me permite contribuir efectivamente al equipo. Adjunto mi CV para su revisión.\n\nSaludos cordiales,\n{cv_data.personal_info.get('name', '')}"
     
     async def generate_form_responses(self, user_id: str, cv_data: CVData, form_questions: List[str]) -> Dict[str, str]:
         """Generar respuestas para formularios basándose en CV"""
-        if user_id not in self.active_chats:
+        chat = await self._get_chat(user_id)
+        if chat is None:
             logger.warning(f"No hay configuración AI para usuario {user_id}")
             return {q: "Información disponible en CV adjunto" for q in form_questions}
         
         try:
-            chat = self.active_chats[user_id]
-            
             prompt = f"""Responde las preguntas de un formulario de postulación basándote únicamente en la información del CV.
 
 DATOS DEL CV:
-{cv_data.raw_text}
+{truncate(cv_data.raw_text, MAX_CV_CHARS)}
 
 PREGUNTAS DEL FORMULARIO:
 {chr(10).join([f"{i+1}. {q}" for i, q in enumerate(form_questions)])}
@@ -168,24 +352,19 @@ INSTRUCCIONES:
 3. Mantén respuestas concisas (máximo 2 líneas por pregunta)
 4. Usa información específica cuando esté disponible
 5. Responde en español profesional
+6. Responde como JSON estricto: {{"numero": "respuesta"}}, por ejemplo {{"1": "...", "2": "..."}}
 
 RESPUESTAS:"""
 
-            message = UserMessage(text=prompt)
-            response = await chat.send_message(message)
+            # Las respuestas son posicionales: solo se reutilizan para el mismo cuestionario
+            response = await self._send(
+                chat, prompt,
+                namespace=self._cache_namespace("form_responses", user_id, cv_data),
+                key_text="\n".join(form_questions),
+                threshold=0.999
+            )
             
-            # Procesar respuesta para crear diccionario
-            responses = {}
-            lines = response.split('\n')
-            for i, question in enumerate(form_questions):
-                # Buscar respuesta correspondiente
-                for line in lines:
-                    if f"{i+1}." in line or question[:20] in line:
-                        answer = line.split(': ', 1)[-1] if ': ' in line else line
-                        responses[question] = answer.strip()
-                        break
-                else:
-                    responses[question] = "Ver información en CV adjunto"
+            responses = self._parse_form_responses(response, form_questions)
             
             logger.info(f"Respuestas de formulario generadas para usuario {user_id}")
             return responses
@@ -196,24 +375,24 @@ RESPUESTAS:"""
     
     async def analyze_job_compatibility(self, user_id: str, cv_data: CVData, job_posting: JobPosting) -> Dict[str, Any]:
         """Analizar compatibilidad entre CV y oferta laboral"""
-        if user_id not in self.active_chats:
+        chat = await self._get_chat(user_id)
+        if chat is None:
             # Análisis básico sin IA
             return self._basic_compatibility_analysis(cv_data, job_posting)
         
         try:
-            chat = self.active_chats[user_id]
-            
+            job = job_prompt_fields(job_posting)
             prompt = f"""Analiza la compatibilidad entre este CV y la oferta laboral.
 
 CV DEL CANDIDATO:
-Experiencia: {cv_data.experience}
-Habilidades: {cv_data.skills}
-Educación: {cv_data.education}
+Experiencia: {truncate(str(cv_data.experience), MAX_SECTION_CHARS)}
+Habilidades: {truncate(", ".join(cv_data.skills), MAX_SECTION_CHARS)}
+Educación: {truncate(str(cv_data.education), MAX_SECTION_CHARS)}
 
 OFERTA LABORAL:
 Cargo: {job_posting.title}
-Requisitos: {job_posting.requirements}
-Descripción: {job_posting.description}
+Requisitos: {job["requirements"]}
+Descripción: {job["description"]}
 
 ANÁLISIS REQUERIDO:
 1. Porcentaje de compatibilidad (0-100%)
@@ -242,41 +421,64 @@ RECOMENDACION: Si/No/Tal vez"""
     
     def _basic_compatibility_analysis(self, cv_data: CVData, job_posting: JobPosting) -> Dict[str, Any]:
         """Análisis básico sin IA"""
-        # Análisis simple basado en keywords
-        cv_text = cv_data.raw_text.lower()
-        job_text = (job_posting.description + " " + " ".join(job_posting.requirements)).lower()
+        key = (cv_data.id, cv_data.updated_at, job_posting.id)
+        cached = self._basic_analysis_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+        
+        # Análisis simple basado en keywords (los tokens del CV se calculan al guardarlo)
+        job_tokens = extract_tokens(job_posting.description + " " + " ".join(job_posting.requirements))
         
         # Palabras clave básicas
-        common_words = set(cv_text.split()) & set(job_text.split())
+        if cv_data.token_set:
+            common_words = job_tokens.intersection(cv_data.token_set)
+        else:
+            # CV sin tokens precalculados: recorrer su texto sin materializar otro conjunto
+            common_words = {
+                match.group() for match in TOKEN_PATTERN.finditer(cv_data.raw_text.lower())
+                if match.group() in job_tokens
+            }
         compatibility = min(len(common_words) * 10, 100)
         
-        return {
+        analysis = {
             "compatibility_percentage": compatibility,
             "strengths": ["Experiencia profesional relevante", "Perfil completo", "Interés en el sector"],
             "weaknesses": ["Revisar requisitos específicos", "Validar experiencia técnica"],
             "recommendation": "Tal vez" if compatibility > 30 else "No",
-            "matched_keywords": list(common_words)[:5]
+            "matched_keywords": sorted(common_words)[:5]
+        }
+        self._basic_analysis_cache.set(key, analysis)
+        return dict(analysis)
+    
+    def _parse_form_responses(self, response: str, form_questions: List[str]) -> Dict[str, str]:
+        """Parsear respuestas numeradas (JSON, o líneas "1. respuesta" como respaldo)"""
+        answers: Dict[str, str] = {}
+        
+        match = JSON_OBJECT_PATTERN.search(response)
+        if match:
+            try:
+                data = json.loads(match.group(0))
+                if isinstance(data, dict):
+                    answers = {str(k).strip(): str(v).strip() for k, v in data.items()}
+            except ValueError:
+                pass
+        
+        if not answers:
+            answers = {num: answer.strip() for num, answer in NUMBERED_ANSWER_PATTERN.findall(response)}
+        
+        return {
+            question: answers.get(str(i + 1)) or "Ver información en CV adjunto"
+            for i, question in enumerate(form_questions)
         }
     
     def _parse_analysis_response(self, response: str) -> Dict[str, Any]:
         """Parsear respuesta de análisis de IA"""
         try:
-            lines = response.split('\n')
             result = {}
             
-            for line in lines:
-                if 'COMPATIBILIDAD:' in line:
-                    percentage = int(line.split(':')[1].strip().replace('%', ''))
-                    result['compatibility_percentage'] = percentage
-                elif 'FORTALEZAS:' in line:
-                    strengths = [s.strip() for s in line.split(':')[1].split(',')]
-                    result['strengths'] = strengths
-                elif 'DEBILIDADES:' in line:
-                    weaknesses = [w.strip() for w in line.split(':')[1].split(',')]
-                    result['weaknesses'] = weaknesses
-                elif 'RECOMENDACION:' in line:
-                    recommendation = line.split(':')[1].strip()
-                    result['recommendation'] = recommendation
+            for field, value in ANALYSIS_FIELD_PATTERN.findall(response):
+                key, convert = ANALYSIS_FIELDS[field]
+                result[key] = convert(value)
             
             # Valores por defecto si falta información
             result.setdefault('compatibility_percentage', 50)
@@ -1,73 +1,173 @@
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from aiolimiter import AsyncLimiter
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import JobApplication, ApplicationStatus, CVData, JobPosting
+from pymongo import UpdateOne
+from models import JobApplication, ApplicationStatus, CVData, JobPosting, JobPortal
 from services.ai_service import AIService
 
 logger = logging.getLogger(__name__)
 
+AI_TIMEOUT_SECONDS = 60
+MAX_CONCURRENT_APPLICATIONS = 5
+BROWSER_WORKERS = 4  # Sesiones Selenium simultáneas
+PORTAL_RATE_LIMIT = 10  # Envíos por segundo a cada portal
+BATCH_FLUSH_SIZE = 100  # Máximo de actualizaciones acumuladas antes de escribirlas
+CLAIM_TIMEOUT = timedelta(minutes=15)  # Tras esto, una postulación tomada sin terminar puede reintentarse
+
+# Datos generados acumulados durante process_batch (None: escribir de inmediato).
+# El estado se escribe siempre al momento: una postulación enviada nunca queda PENDING
+# esperando al lote, donde podría volver a tomarse al vencer CLAIM_TIMEOUT.
+_pending_updates: ContextVar[Optional[List[UpdateOne]]] = ContextVar("pending_updates", default=None)
+
+# raw_text es el campo más pesado del CV y el procesamiento solo lo usa si no hay token_set
+# (la IA trabaja con experiencia, habilidades y educación)
+CV_RAW_TEXT_IF_NEEDED = {
+    "$cond": [{"$gt": [{"$size": {"$ifNull": ["$token_set", []]}}, 0]}, "", "$raw_text"]
+}
+
+# Índice para estadísticas por usuario y rango de fechas (cubre el $group por estado)
+APPLICATION_STATS_INDEX = [("user_id", 1), ("created_at", -1), ("status", 1)]
+
 
 class ApplicationService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncIOMotorDatabase, ai_service: Optional[AIService] = None):
         self.db = db
-        self.ai_service = AIService()
+        self.ai_service = ai_service or AIService()
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_APPLICATIONS)
+        # Selenium bloquea: corre en hilos propios para no detener el event loop
+        self._browser_pool = ThreadPoolExecutor(max_workers=BROWSER_WORKERS, thread_name_prefix="browser")
+        self._portal_limiters = {portal.value: AsyncLimiter(PORTAL_RATE_LIMIT, 1) for portal in JobPortal}
+        self._portal_handlers = {
+            JobPortal.LINKEDIN.value: self._apply_linkedin,
+            JobPortal.LABORUM.value: self._apply_laborum,
+            JobPortal.BNE.value: self._apply_bne,
+            JobPortal.TRABAJANDO.value: self._apply_trabajando
+        }
+    
+    def shutdown(self):
+        """Liberar el pool de navegadores"""
+        self._browser_pool.shutdown(wait=False, cancel_futures=True)
+    
+    async def _run_blocking(self, func, *args):
+        """Ejecutar código bloqueante (Selenium) en el pool de navegadores"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._browser_pool, func, *args)
+    
+    async def process_batch(self, application_ids: List[str]):
+        """Procesar varias postulaciones en paralelo (limitado por el semáforo)"""
+        updates: List[UpdateOne] = []
+        token = _pending_updates.set(updates)
+        try:
+            await asyncio.gather(*(self.process_application(application_id) for application_id in application_ids))
+        finally:
+            _pending_updates.reset(token)
+            await self._flush_updates(updates)
     
     async def process_application(self, application_id: str):
         """Procesar una postulación en background"""
+        async with self._semaphore:
+            await self._process_application(application_id)
+    
+    async def _claim(self, application_id: str) -> bool:
+        """Marcar la postulación pendiente como tomada; False si otro proceso ya la está enviando"""
+        now = datetime.now(timezone.utc)
+        claimed = await self.db.applications.find_one_and_update(
+            {
+                "id": application_id,
+                "status": ApplicationStatus.PENDING.value,
+                "$or": [{"claimed_at": None}, {"claimed_at": {"$lt": now - CLAIM_TIMEOUT}}]
+            },
+            {"$set": {"claimed_at": now}},
+            projection={"_id": 1}
+        )
+        return claimed is not None
+    
+    async def _process_application(self, application_id: str):
+        if not await self._claim(application_id):
+            logger.info(f"Aplicación {application_id} ya procesada o en proceso")
+            return
+        
         try:
-            # Obtener aplicación
-            app_doc = await self.db.applications.find_one({"id": application_id})
-            if not app_doc:
+            # Obtener aplicación, trabajo y CV en una sola consulta
+            pipeline = [
+                {"$match": {"id": application_id}},
+                {"$limit": 1},
+                {"$lookup": {"from": "jobs", "localField": "job_id", "foreignField": "id", "as": "job"}},
+                {"$lookup": {
+                    "from": "cvs", "let": {"cv_id": "$cv_used"}, "as": "cv",
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$id", "$$cv_id"]}}},
+                        {"$limit": 1},
+                        {"$set": {"raw_text": CV_RAW_TEXT_IF_NEEDED}},
+                        {"$project": {"_id": 0}}
+                    ]
+                }},
+                {"$unwind": {"path": "$job", "preserveNullAndEmptyArrays": True}},
+                {"$unwind": {"path": "$cv", "preserveNullAndEmptyArrays": True}}
+            ]
+            docs = await self.db.applications.aggregate(pipeline).to_list(1)
+            if not docs:
                 logger.error(f"Aplicación {application_id} no encontrada")
                 return
             
-            application = JobApplication(**app_doc)
-            
-            # Obtener trabajo y CV
-            job_doc = await self.db.jobs.find_one({"id": application.job_id})
-            cv_doc = await self.db.cvs.find_one({"id": application.cv_used})
+            app_doc = docs[0]
+            job_doc = app_doc.pop("job", None)
+            cv_doc = app_doc.pop("cv", None)
+            application = JobApplication.model_validate(app_doc)
             
             if not job_doc or not cv_doc:
                 logger.error(f"Datos faltantes para aplicación {application_id}")
                 await self._update_application_status(application_id, ApplicationStatus.REJECTED, "Datos incompletos")
                 return
             
-            job_posting = JobPosting(**job_doc)
-            cv_data = CVData(**cv_doc)
+            job_posting = JobPosting.model_validate(job_doc)
+            cv_data = CVData.model_validate(cv_doc)
             
-            # Generar carta de presentación si no existe
-            if not application.cover_letter:
-                cover_letter = await self.ai_service.generate_cover_letter(
-                    application.user_id, cv_data, job_posting
-                )
-                application.cover_letter = cover_letter
+            # Generar en paralelo CV personalizado, análisis y carta (si no existe)
+            ai_results = await self._run_ai_tasks(application, job_posting, cv_data)
+            
+            if ai_results.get("cover_letter"):
+                application.cover_letter = ai_results["cover_letter"]
+            if ai_results.get("personalized_cv"):
+                cv_data = cv_data.model_copy(update={"raw_text": ai_results["personalized_cv"]})
+            elif not cv_data.raw_text:
+                # Sin CV personalizado el portal recibe el original, que la consulta omitió
+                cv_data = cv_data.model_copy(update={"raw_text": await self._get_raw_text(cv_data.id)})
+            application.match_analysis = ai_results.get("match_analysis")
             
             # Procesar según portal
-            success = False
-            if job_posting.portal.value == "linkedin":
-                success = await self._apply_linkedin(application, job_posting, cv_data)
-            elif job_posting.portal.value == "laborum":
-                success = await self._apply_laborum(application, job_posting, cv_data)
-            elif job_posting.portal.value == "bne":
-                success = await self._apply_bne(application, job_posting, cv_data)
-            elif job_posting.portal.value == "trabajando":
-                success = await self._apply_trabajando(application, job_posting, cv_data)
+            handler = self._portal_handlers.get(job_posting.portal.value)
+            if handler:
+                async with self._portal_limiters[job_posting.portal.value]:
+                    success = await handler(application, job_posting, cv_data)
+            else:
+                success = False
             
             # Actualizar estado
+            generated_data = {
+                "cover_letter": application.cover_letter,
+                "match_analysis": application.match_analysis,
+                "portal_data": application.portal_data
+            }
             if success:
                 await self._update_application_status(
                     application_id, 
                     ApplicationStatus.APPLIED, 
-                    f"Postulación enviada a {job_posting.company}"
+                    f"Postulación enviada a {job_posting.company}",
+                    generated_data
                 )
                 logger.info(f"Aplicación {application_id} enviada exitosamente")
             else:
                 await self._update_application_status(
                     application_id, 
                     ApplicationStatus.REJECTED, 
-                    "Error en el envío"
+                    "Error en el envío",
+                    generated_data
                 )
                 logger.error(f"Aplicación {application_id} falló")
         
@@ -75,37 +175,73 @@ class ApplicationService:
             logger.error(f"Error procesando aplicación {application_id}: {e}")
             await self._update_application_status(application_id, ApplicationStatus.REJECTED, str(e))
     
-    async def _update_application_status(self, application_id: str, status: ApplicationStatus, notes: str = ""):
+    async def _get_raw_text(self, cv_id: str) -> str:
+        """Texto completo del CV (omitido en la consulta principal cuando hay token_set)"""
+        doc = await self.db.cvs.find_one({"id": cv_id}, {"_id": 0, "raw_text": 1})
+        return doc["raw_text"] if doc else ""
+    
+    async def _run_ai_tasks(self, application: JobApplication, job: JobPosting, cv: CVData) -> Dict[str, Any]:
+        """Ejecutar las llamadas de IA independientes en paralelo, cada una con timeout"""
+        calls = {
+            "personalized_cv": self.ai_service.personalize_cv(application.user_id, cv, job),
+            "match_analysis": self.ai_service.analyze_job_compatibility(application.user_id, cv, job)
+        }
+        if not application.cover_letter:
+            calls["cover_letter"] = self.ai_service.generate_cover_letter(application.user_id, cv, job)
+        
+        results = await asyncio.gather(
+            *(asyncio.wait_for(call, AI_TIMEOUT_SECONDS) for call in calls.values()),
+            return_exceptions=True
+        )
+        
+        ai_results = {}
+        for name, result in zip(calls, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"IA ({name}) no disponible para aplicación {application.id}: {result!r}")
+                result = None
+            ai_results[name] = result
+        return ai_results
+    
+    async def _update_application_status(self, application_id: str, status: ApplicationStatus, notes: str = "",
+                                         extra: Optional[Dict[str, Any]] = None):
         """Actualizar estado de aplicación"""
+        now = datetime.now(timezone.utc)
         update_data = {
             "status": status.value,
-            "last_update": datetime.utcnow(),
+            "last_update": now,
             "notes": notes
         }
-        
         if status == ApplicationStatus.APPLIED:
-            update_data["applied_at"] = datetime.utcnow()
+            update_data["applied_at"] = now
         
-        await self.db.applications.update_one(
-            {"id": application_id},
-            {"$set": update_data}
-        )
+        pending = _pending_updates.get()
+        if extra and pending is None:
+            update_data.update(extra)
+        
+        await self.db.applications.update_one({"id": application_id}, {"$set": update_data})
+        
+        if extra and pending is not None:
+            pending.append(UpdateOne({"id": application_id}, {"$set": extra}))
+            if len(pending) >= BATCH_FLUSH_SIZE:
+                await self._flush_updates(pending)
+    
+    async def _flush_updates(self, pending: List[UpdateOne]):
+        """Escribir en un solo bulk_write las actualizaciones acumuladas"""
+        updates = pending[:]
+        pending.clear()
+        if updates:
+            await self.db.applications.bulk_write(updates, ordered=False)
     
     async def _apply_linkedin(self, application: JobApplication, job: JobPosting, cv: CVData) -> bool:
         """Aplicar a trabajo en LinkedIn"""
         try:
             logger.info(f"Simulando aplicación LinkedIn para: {job.title} en {job.company}")
             
-            # TODO: Implementar aplicación real con Selenium
             # Por ahora simular éxito
             await asyncio.sleep(2)  # Simular tiempo de procesamiento
             
             # Marcar como aplicado
-            application.portal_data = {
-                "method": "linkedin_easy_apply",
-                "timestamp": datetime.utcnow().isoformat(),
-                "cover_letter_sent": bool(application.cover_letter)
-            }
+            application.portal_data = await self._run_blocking(self._sync_apply_linkedin, application, job, cv)
             
             return True
             
@@ -113,6 +249,15 @@ class ApplicationService:
             logger.error(f"Error aplicando LinkedIn: {e}")
             return False
     
+    def _sync_apply_linkedin(self, application: JobApplication, job: JobPosting, cv: CVData) -> Dict[str, Any]:
+        """Envío en LinkedIn (bloqueante, se ejecuta en el pool de navegadores)"""
+        # TODO: Implementar aplicación real con Selenium
+        return {
+            "method": "linkedin_easy_apply",
+            "timestamp": datetime.utcnow().isoformat(),
+            "cover_letter_sent": bool(application.cover_letter)
+        }
+    
     async def _apply_laborum(self, application: JobApplication, job: JobPosting, cv: CVData) -> bool:
         """Aplicar a trabajo en Laborum"""
         try:
@@ -181,7 +326,7 @@ class ApplicationService:
             {"$group": {"_id": "$status", "count": {"$sum": 1}}}
         ]
         
-        status_counts = await self.db.applications.aggregate(pipeline).to_list(10)
+        status_counts = await self.db.applications.aggregate(pipeline, hint=APPLICATION_STATS_INDEX).to_list(10)
         
         # Calcular tasas
         total_apps = sum(item["count"] for item in status_counts)
@@ -0,0 +1,88 @@
+import re
+from typing import Dict, List, Optional, Tuple
+import soupsieve
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:  # Respaldo: BeautifulSoup + lxml
+    HTMLParser = None
+
+
+class CardSpec:
+    """Selectores de las tarjetas de trabajo de un portal.
+
+    fields asocia cada campo con selectores CSS en orden de preferencia (se usa
+    el primero que encuentre un elemento). El campo "title" es obligatorio y
+    define además el enlace de la tarjeta.
+    """
+
+    def __init__(self, classes: List[str], fields: Dict[str, Tuple[str, ...]]):
+        self.classes = classes
+        self.fields = fields
+        self.selector = ", ".join(f"div.{name}" for name in classes)
+        self.class_set = frozenset(classes)
+
+        # Al parsear, class llega como texto completo ("oferta destacada"): buscar cada clase como palabra
+        pattern = re.compile(r"(?:^|\s)(?:%s)(?:\s|$)" % "|".join(map(re.escape, classes)))
+        self.strainer = SoupStrainer('div', class_=pattern)
+
+        # Selectores compilados una vez para el respaldo con BeautifulSoup
+        selectors = {self.selector, *(selector for options in fields.values() for selector in options)}
+        self.compiled = {selector: soupsieve.compile(selector) for selector in selectors}
+
+
+def extract_cards(content: bytes, spec: CardSpec, limit: int) -> List[Dict[str, Optional[str]]]:
+    """Texto de los campos de las primeras `limit` tarjetas, más el href de su enlace"""
+    if HTMLParser is not None:
+        return _extract_selectolax(content, spec, limit)
+    return _extract_soup(content, spec, limit)
+
+
+def _extract_selectolax(content: bytes, spec: CardSpec, limit: int) -> List[Dict[str, Optional[str]]]:
+    cards = []
+    for card in _select_cards(HTMLParser(content), spec, limit):
+        nodes = {name: _first(card.css_first, selectors) for name, selectors in spec.fields.items()}
+        values = {name: node.text(strip=True) if node is not None else None for name, node in nodes.items()}
+
+        title = nodes["title"]
+        link = (title.css_first('a') if title is not None else None) or card.css_first('a')
+        values["href"] = link.attributes.get('href') if link is not None else None
+        cards.append(values)
+    return cards
+
+
+def _select_cards(tree, spec: CardSpec, limit: int) -> list:
+    """Tarjetas en orden del documento (con varios selectores css() las agrupa por selector)"""
+    cards = []
+    for node in tree.css('div'):
+        if spec.class_set.intersection((node.attributes.get('class') or '').split()):
+            cards.append(node)
+            if len(cards) == limit:
+                break
+    return cards
+
+
+def _extract_soup(content: bytes, spec: CardSpec, limit: int) -> List[Dict[str, Optional[str]]]:
+    cards = []
+    soup = BeautifulSoup(content, 'lxml', parse_only=spec.strainer)
+    for card in spec.compiled[spec.selector].select(soup, limit=limit):
+        nodes = {
+            name: _first(lambda selector: spec.compiled[selector].select_one(card), selectors)
+            for name, selectors in spec.fields.items()
+        }
+        values = {name: node.get_text(strip=True) if node is not None else None for name, node in nodes.items()}
+
+        title = nodes["title"]
+        link = (title.find('a') if title is not None else None) or card.find('a')
+        values["href"] = link.get('href') if link is not None else None
+        cards.append(values)
+    return cards
+
+
+def _first(select, selectors: Tuple[str, ...]):
+    for selector in selectors:
+        node = select(selector)
+        if node is not None:
+            return node
+    return None
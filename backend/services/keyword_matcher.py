@@ -0,0 +1,54 @@
+import re
+from functools import lru_cache
+from typing import List, Tuple
+from models import SearchFilters
+
+try:
+    import ahocorasick
+except ImportError:  # Respaldo: una sola regex compilada
+    ahocorasick = None
+
+
+class KeywordMatcher:
+    """Buscar todas las keywords de un filtro en una sola pasada (Aho-Corasick)"""
+
+    def __init__(self, keywords: Tuple[str, ...]):
+        self.keywords = keywords
+        self._automaton = None
+        self._pattern = None
+
+        if not keywords:
+            return
+
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in keywords:
+                self._automaton.add_word(keyword.lower(), keyword.lower())
+            self._automaton.make_automaton()
+        else:
+            # Lookahead para contar coincidencias solapadas; las más largas primero
+            alternatives = sorted({re.escape(keyword.lower()) for keyword in keywords}, key=len, reverse=True)
+            self._pattern = re.compile(f"(?=({'|'.join(alternatives)}))")
+
+    def find(self, text: str) -> List[str]:
+        """Keywords contenidas en el texto, en el orden del filtro"""
+        if not text or (self._automaton is None and self._pattern is None):
+            return []
+
+        if self._automaton is not None:
+            found = {match for _, match in self._automaton.iter(text.lower())}
+        else:
+            found = set(self._pattern.findall(text.lower()))
+            # Keywords más cortas contenidas en una coincidencia más larga
+            found.update(keyword.lower() for keyword in self.keywords if any(keyword.lower() in match for match in found))
+        return [keyword for keyword in self.keywords if keyword.lower() in found]
+
+
+@lru_cache(maxsize=1024)
+def _get_matcher(filter_id: str, keywords: Tuple[str, ...]) -> KeywordMatcher:
+    return KeywordMatcher(keywords)
+
+
+def get_matcher(filters: SearchFilters) -> KeywordMatcher:
+    """Matcher compilado para un filtro (se reconstruye si cambian sus keywords)"""
+    return _get_matcher(filters.id, tuple(filters.keywords))
@@ -1,26 +1,152 @@
 import asyncio
+import hashlib
 import random
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from bs4 import BeautifulSoup
-import requests
+from contextlib import asynccontextmanager
+from datetime import datetime, time, timedelta, timezone
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlparse
+from playwright.async_api import async_playwright, Browser, Playwright, TimeoutError as PlaywrightTimeoutError
+import httpx
+from yarl import URL
+from aiolimiter import AsyncLimiter
 from fake_useragent import UserAgent
-from models import JobPosting, JobPortal, SearchFilters, WorkMode, JobType
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from models import JobPosting, JobPortal, SearchFilters, WorkMode, JobType, frozen_now
+from services.keyword_matcher import get_matcher
+from services.card_parser import CardSpec, extract_cards
 
 logger = logging.getLogger(__name__)
 
 
+HTTP_TIMEOUT = httpx.Timeout(30.0)
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+LABORUM_BASE_URL = URL("https://www.trabajando.com")
+BNE_BASE_URL = URL("https://www.bne.cl")
+TRABAJANDO_BASE_URL = URL("https://cl.trabajando.com")
+MAX_CONCURRENT_PER_HOST = 8
+MAX_PAGE_BYTES = 512_000  # Los listados están al inicio; el resto es JS y footer
+PAGE_END_MARKER = b'</main>'
+HOST_REQUEST_INTERVAL = 3.0  # Segundos entre requests a un mismo dominio (en promedio)
+
+LINKEDIN_LOAD_TIMEOUT_MS = 10_000
+BROWSER_ARGS = ['--no-sandbox', '--disable-dev-shm-usage', '--disable-blink-features=AutomationControlled']
+HIDE_WEBDRIVER_SCRIPT = "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+
+# Extrae todas las tarjetas de LinkedIn en una sola evaluación en la página
+LINKEDIN_CARDS_SCRIPT = """
+(limit) => {
+    const field = (card, selector) => card.querySelector(selector)?.innerText?.trim() || null;
+    return Array.from(document.querySelectorAll('[data-job-id]')).slice(0, limit).map(card => {
+        const link = card.querySelector('h3 a');
+        return {
+            id: card.getAttribute('data-job-id'),
+            href: link?.href || null,
+            title: link?.innerText?.trim() || null,
+            company: field(card, "[data-tracking-control-name='public_jobs_jserp-result_job-search-card-subtitle']"),
+            location: field(card, "[data-tracking-control-name='public_jobs_jserp-result_job-search-card-location']")
+        };
+    });
+}
+"""
+
+# fake_useragent 1.x marca los de escritorio como "pc" (navegador en minúsculas); 2.x como "desktop"
+DESKTOP_DEVICE_TYPES = ("pc", "desktop")
+
+# Respaldo si fake_useragent no trae datos de navegadores de escritorio
+DEFAULT_USER_AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0",
+)
+
+# Tarjetas de trabajo por portal (ajustar selectores según cada sitio)
+LABORUM_CARDS = CardSpec(['job-item', 'job-card'], {
+    "title": ("h3", "a.job-title"),
+    "company": (".company-name, .empresa",),
+    "location": (".location, .ubicacion",)
+})
+BNE_CARDS = CardSpec(['trabajo', 'empleo-item'], {
+    "title": ("h3", "a.titulo"),
+    "company": (".empresa",)
+})
+TRABAJANDO_CARDS = CardSpec(['oferta', 'trabajo-card'], {
+    "title": ("h2", ".titulo-oferta"),
+    "company": (".nombre-empresa, .company",)
+})
+
+
+# Empresa usada cuando la tarjeta no la trae
+PLACEHOLDER_COMPANY = {
+    JobPortal.LABORUM: "No especificado",
+    JobPortal.BNE: "Empleador BNE",
+    JobPortal.TRABAJANDO: "Empresa"
+}
+
+STABLE_ID_PREFIX = "h-"  # Distingue los IDs derivados de los propios del portal
+
+
+def stable_external_id(*parts: str) -> str:
+    """ID estable para ofertas sin ID propio en el portal"""
+    return STABLE_ID_PREFIX + hashlib.blake2b("|".join(parts).encode(), digest_size=8).hexdigest()
+
+
+def derived_external_id(portal: JobPortal, url: str, title: str, company: str) -> str:
+    """ID a partir del enlace de la oferta o, si no hay, de portal, cargo y empresa (nunca de la búsqueda)"""
+    return stable_external_id(url) if url else stable_external_id(portal.value, title, company)
+
+
+def has_native_id(job: JobPosting) -> bool:
+    return not job.external_id.startswith(STABLE_ID_PREFIX)
+
+
+def card_url(base: URL, href: Optional[str]) -> str:
+    """Enlace absoluto de la tarjeta ("" si no tiene)"""
+    return str(base.join(URL(href))) if href else ""
+
+
+def dedupe_jobs(batches: List[Tuple[JobPortal, List[JobPosting]]]) -> Tuple[List[JobPosting], Dict[JobPortal, int]]:
+    """Eliminar repetidos y contar los agregados por portal.
+    
+    Las ofertas con ID propio se deduplican solo por (portal, external_id). Las que
+    tienen ID derivado además se descartan si ya hay otra con la misma empresa y
+    cargo (Laborum y Trabajando.com comparten sitio), salvo que la empresa sea
+    el valor de relleno del portal. Las de ID propio se procesan primero para
+    que sean las que se conservan.
+    """
+    jobs: List[JobPosting] = []
+    added = {portal: 0 for portal, _ in batches}
+    seen_ids = set()
+    seen_titles = set()
+    
+    for native in (True, False):
+        for portal, batch in batches:
+            for job in batch:
+                if has_native_id(job) is not native:
+                    continue
+                
+                job_key = (job.portal, job.external_id)
+                title_key = None
+                if job.company != PLACEHOLDER_COMPANY.get(job.portal):
+                    title_key = (job.company.lower(), job.title.lower())
+                
+                if job_key in seen_ids or (not native and title_key in seen_titles):
+                    continue
+                seen_ids.add(job_key)
+                if title_key is not None:
+                    seen_titles.add(title_key)
+                jobs.append(job)
+                added[portal] += 1
+    
+    return jobs, added
+
+
 class ScraperService:
-    def __init__(self):
-        self.ua = UserAgent()
-        self.session = requests.Session()
+    def __init__(self, db: AsyncIOMotorDatabase, session: Optional[httpx.AsyncClient] = None):
+        self.db = db  # Cliente Motor compartido (pool de conexiones de la app)
+        self.user_agents = self._load_user_agents()
+        self.session = session  # Sesión HTTP compartida, inyectada al iniciar la app
         self.daily_limits = {
             JobPortal.LINKEDIN: 20,
             JobPortal.LABORUM: 15, 
@@ -28,80 +154,154 @@ class ScraperService:
             JobPortal.TRABAJANDO: 15
         }
         self.current_counts = {portal: 0 for portal in JobPortal}
-        self.last_reset = datetime.utcnow().date()
+        self._reset_handle: Optional[asyncio.TimerHandle] = None
+        self._hosts: Dict[str, Tuple[asyncio.Semaphore, AsyncLimiter]] = {}
+        # Un solo Chromium reutilizado; cada scrape abre su propio contexto aislado
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self._browser_lock = asyncio.Lock()
+        self._scrapers = {
+            JobPortal.LINKEDIN: self._scrape_linkedin,
+            JobPortal.LABORUM: self._scrape_laborum,
+            JobPortal.BNE: self._scrape_bne,
+            JobPortal.TRABAJANDO: self._scrape_trabajando
+        }
     
-    def _reset_daily_limits(self):
-        """Resetear contadores diarios si es un nuevo día"""
-        today = datetime.utcnow().date()
-        if today > self.last_reset:
-            self.current_counts = {portal: 0 for portal in JobPortal}
-            self.last_reset = today
-            logger.info("Límites diarios reseteados")
+    @staticmethod
+    def _load_user_agents() -> tuple:
+        """User agents de Chrome/Firefox de escritorio, cargados una sola vez"""
+        try:
+            agents = tuple(
+                item["useragent"] for item in UserAgent().data_browsers
+                if item.get("type") in DESKTOP_DEVICE_TYPES
+                and str(item.get("browser", "")).lower() in ("chrome", "firefox")
+            )
+        except Exception as e:
+            logger.warning(f"No se pudieron cargar user agents: {e}")
+            agents = ()
+        return agents or DEFAULT_USER_AGENTS
     
-    def _get_chrome_driver(self) -> webdriver.Chrome:
-        """Crear driver de Chrome con configuración anti-detección"""
-        options = Options()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument(f'--user-agent={self.ua.random}')
-        options.add_argument('--disable-blink-features=AutomationControlled')
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
+    @staticmethod
+    def create_session() -> httpx.AsyncClient:
+        """Crear cliente HTTP/2 con pool de conexiones compartido entre portales.
         
-        driver = webdriver.Chrome(options=options)
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        Con HTTP/2 los requests a un mismo dominio se multiplexan sobre una sola
+        conexión TLS; los servidores que no lo negocian siguen con HTTP/1.1.
+        """
+        return httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, follow_redirects=True)
+    
+    async def close(self):
+        """Cerrar la sesión HTTP y el navegador"""
+        if self._reset_handle is not None:
+            self._reset_handle.cancel()
+        
+        if self.session is not None and not self.session.is_closed:
+            await self.session.aclose()
         
-        return driver
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
     
-    async def _human_delay(self, min_seconds: float = 2.0, max_seconds: float = 8.0):
-        """Simular delays humanos"""
-        delay = random.uniform(min_seconds, max_seconds)
-        await asyncio.sleep(delay)
+    async def _get_browser(self) -> Browser:
+        """Navegador compartido; se lanza si no existe o si se desconectó"""
+        async with self._browser_lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+            return self._browser
     
-    async def search_jobs(self, filters: SearchFilters) -> List[JobPosting]:
-        """Buscar trabajos en todos los portales configurados"""
-        self._reset_daily_limits()
-        all_jobs = []
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        """Ritmo y concurrencia por dominio (www. y cl.trabajando.com comparten límite).
         
+        Cada dominio tiene su propio token bucket, así los portales no se esperan entre sí.
+        """
+        domain = ".".join((urlparse(url).hostname or "").split(".")[-2:])
+        limits = self._hosts.get(domain)
+        if limits is None:
+            limits = self._hosts[domain] = (
+                asyncio.Semaphore(MAX_CONCURRENT_PER_HOST),
+                AsyncLimiter(1, HOST_REQUEST_INTERVAL)
+            )
+        
+        semaphore, limiter = limits
+        async with limiter, semaphore:
+            yield
+    
+    @staticmethod
+    async def _read_page(response: httpx.Response) -> bytes:
+        """Leer el cuerpo por partes hasta el fin del contenido principal o MAX_PAGE_BYTES"""
+        buffer = bytearray()
+        async for chunk in response.aiter_bytes(16384):
+            # Buscar también en el borde con la parte anterior
+            search_from = max(len(buffer) - len(PAGE_END_MARKER), 0)
+            buffer.extend(chunk)
+            if buffer.find(PAGE_END_MARKER, search_from) != -1 or len(buffer) >= MAX_PAGE_BYTES:
+                break
+        return bytes(buffer)
+    
+    def schedule_daily_reset(self):
+        """Programar el reseteo de contadores para la próxima medianoche UTC"""
+        now = datetime.now(timezone.utc)
+        midnight = datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=timezone.utc)
+        self._reset_handle = asyncio.get_running_loop().call_later(
+            (midnight - now).total_seconds(), self._reset_daily_limits
+        )
+    
+    def _reset_daily_limits(self):
+        """Resetear contadores diarios y programar el siguiente reseteo"""
+        self.current_counts = {portal: 0 for portal in JobPortal}
+        logger.info("Límites diarios reseteados")
+        self.schedule_daily_reset()
+    
+    async def search_jobs(self, filters: SearchFilters) -> List[JobPosting]:
+        """Buscar trabajos en todos los portales configurados (en paralelo)"""
+        log_info = logger.isEnabledFor(logging.INFO)
+        portals = []
         for portal in filters.portals:
+            if portal not in self._scrapers:
+                continue
             if self.current_counts[portal] >= self.daily_limits[portal]:
-                logger.info(f"Límite diario alcanzado para {portal}")
+                if log_info:
+                    logger.info(f"Límite diario alcanzado para {portal}")
                 continue
-            
-            try:
-                if portal == JobPortal.LINKEDIN:
-                    jobs = await self._scrape_linkedin(filters)
-                elif portal == JobPortal.LABORUM:
-                    jobs = await self._scrape_laborum(filters)
-                elif portal == JobPortal.BNE:
-                    jobs = await self._scrape_bne(filters)
-                elif portal == JobPortal.TRABAJANDO:
-                    jobs = await self._scrape_trabajando(filters)
-                else:
-                    jobs = []
-                
-                all_jobs.extend(jobs)
-                self.current_counts[portal] += len(jobs)
-                
-                logger.info(f"Encontrados {len(jobs)} trabajos en {portal}")
-                
-                # Delay entre portales
-                await self._human_delay(10, 20)
-                
-            except Exception as e:
-                logger.error(f"Error scrapeando {portal}: {e}")
+            portals.append(portal)
+        
+        results = await asyncio.gather(
+            *(self._scrape_portal(portal, filters) for portal in portals),
+            return_exceptions=True
+        )
+        
+        batches = []
+        for portal, jobs in zip(portals, results):
+            if isinstance(jobs, BaseException):
+                logger.error(f"Error scrapeando {portal}: {jobs}")
                 continue
+            batches.append((portal, jobs))
+        
+        all_jobs, added = dedupe_jobs(batches)
+        for portal, count in added.items():
+            self.current_counts[portal] += count
+            if log_info:
+                logger.info(f"Encontrados {count} trabajos en {portal}")
         
         return all_jobs
     
+    async def _scrape_portal(self, portal: JobPortal, filters: SearchFilters) -> List[JobPosting]:
+        """Scrapear un portal; todos sus trabajos comparten timestamp"""
+        with frozen_now():
+            return await self._scrapers[portal](filters)
+    
     async def _scrape_linkedin(self, filters: SearchFilters) -> List[JobPosting]:
         """Scraper para LinkedIn"""
         jobs = []
-        driver = None
         
         try:
-            driver = self._get_chrome_driver()
+            browser = await self._get_browser()
             
             # Construir URL de búsqueda
             keywords = " ".join(filters.keywords)
@@ -109,33 +309,43 @@ class ScraperService:
             
             search_url = f"https://www.linkedin.com/jobs/search/?keywords={keywords}&location={location}"
             
-            driver.get(search_url)
-            await self._human_delay(3, 6)
-            
-            # Obtener lista de trabajos
-            job_cards = driver.find_elements(By.CSS_SELECTOR, "[data-job-id]")
+            context = await browser.new_context(user_agent=random.choice(self.user_agents))
+            try:
+                await context.add_init_script(HIDE_WEBDRIVER_SCRIPT)
+                page = await context.new_page()
+                await page.goto(search_url)
+                
+                # Esperar a que carguen las tarjetas en vez de una pausa fija
+                try:
+                    await page.wait_for_selector("[data-job-id] h3 a", timeout=LINKEDIN_LOAD_TIMEOUT_MS)
+                except PlaywrightTimeoutError:
+                    logger.info("LinkedIn no mostró resultados a tiempo")
+                    return jobs
+                
+                # Obtener lista de trabajos
+                job_cards = await page.evaluate(LINKEDIN_CARDS_SCRIPT, self.daily_limits[JobPortal.LINKEDIN]) or []
+            finally:
+                await context.close()
             
-            for card in job_cards[:self.daily_limits[JobPortal.LINKEDIN]]:
+            for card in job_cards:
                 try:
-                    job_id = card.get_attribute("data-job-id")
-                    title_element = card.find_element(By.CSS_SELECTOR, "h3 a")
-                    company_element = card.find_element(By.CSS_SELECTOR, "[data-tracking-control-name='public_jobs_jserp-result_job-search-card-subtitle']")
-                    location_element = card.find_element(By.CSS_SELECTOR, "[data-tracking-control-name='public_jobs_jserp-result_job-search-card-location']")
+                    if not all(card.get(field) for field in ("id", "href", "title", "company", "location")):
+                        continue
                     
-                    job = JobPosting(
+                    # Campos ya normalizados a str: construir sin validar
+                    job = JobPosting.model_construct(
                         portal=JobPortal.LINKEDIN,
-                        external_id=job_id,
-                        url=title_element.get_attribute("href"),
-                        title=title_element.text.strip(),
-                        company=company_element.text.strip(),
-                        location=location_element.text.strip(),
+                        external_id=card["id"],
+                        url=card["href"],
+                        title=card["title"],
+                        company=card["company"],
+                        location=card["location"],
                         description="",  # Se llenará después
                         requirements=[],
-                        keywords_matched=self._find_matching_keywords(title_element.text, filters.keywords)
+                        keywords_matched=self._find_matching_keywords(card["title"], filters)
                     )
                     
                     jobs.append(job)
-                    await self._human_delay(1, 3)
                     
                 except Exception as e:
                     logger.warning(f"Error procesando trabajo LinkedIn: {e}")
@@ -144,10 +354,6 @@ class ScraperService:
         except Exception as e:
             logger.error(f"Error general LinkedIn: {e}")
         
-        finally:
-            if driver:
-                driver.quit()
-        
         return jobs
     
     async def _scrape_laborum(self, filters: SearchFilters) -> List[JobPosting]:
@@ -161,44 +367,39 @@ class ScraperService:
             search_url = f"https://www.trabajando.com/trabajo-empleo/{keywords}/{location}"
             
             headers = {
-                'User-Agent': self.ua.random,
+                'User-Agent': random.choice(self.user_agents),
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
                 'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive',
             }
             
-            response = self.session.get(search_url, headers=headers, timeout=30)
-            response.raise_for_status()
+            async with self._host_slot(search_url):
+                async with self.session.stream("GET", search_url, headers=headers) as response:
+                    response.raise_for_status()
+                    content = await self._read_page(response)
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            job_cards = soup.find_all('div', class_=['job-item', 'job-card'])
-            
-            for card in job_cards[:self.daily_limits[JobPortal.LABORUM]]:
+            for card in extract_cards(content, LABORUM_CARDS, self.daily_limits[JobPortal.LABORUM]):
                 try:
-                    title_elem = card.find('h3') or card.find('a', class_='job-title')
-                    company_elem = card.find(class_=['company-name', 'empresa'])
-                    location_elem = card.find(class_=['location', 'ubicacion'])
-                    
-                    if not title_elem:
+                    if not card["title"]:
                         continue
                     
                     # Extraer URL
-                    link_elem = title_elem.find('a') or card.find('a')
-                    job_url = link_elem.get('href') if link_elem else ""
-                    if job_url and not job_url.startswith('http'):
-                        job_url = "https://www.trabajando.com" + job_url
+                    job_url, job_id = "", ""
+                    if card["href"]:
+                        url = LABORUM_BASE_URL.join(URL(card["href"]))
+                        job_url = str(url)
+                        job_id = url.path.rstrip('/').rsplit('/', 1)[-1] or url.query_string
+                    company = card["company"] or PLACEHOLDER_COMPANY[JobPortal.LABORUM]
                     
-                    job = JobPosting(
+                    job = JobPosting.model_construct(
                         portal=JobPortal.LABORUM,
-                        external_id=job_url.split('/')[-1] if job_url else str(random.randint(10000, 99999)),
+                        external_id=job_id or derived_external_id(JobPortal.LABORUM, job_url, card["title"], company),
                         url=job_url,
-                        title=title_elem.get_text(strip=True),
-                        company=company_elem.get_text(strip=True) if company_elem else "No especificado",
-                        location=location_elem.get_text(strip=True) if location_elem else location,
+                        title=card["title"],
+                        company=company,
+                        location=card["location"] or location,
                         description="",
                         requirements=[],
-                        keywords_matched=self._find_matching_keywords(title_elem.get_text(), filters.keywords)
+                        keywords_matched=self._find_matching_keywords(card["title"], filters)
                     )
                     
                     jobs.append(job)
@@ -207,8 +408,6 @@ class ScraperService:
                     logger.warning(f"Error procesando trabajo Laborum: {e}")
                     continue
             
-            await self._human_delay(3, 8)
-        
         except Exception as e:
             logger.error(f"Error general Laborum: {e}")
         
@@ -226,36 +425,34 @@ class ScraperService:
             search_url = f"https://www.bne.cl/buscar-trabajo?q={keywords}"
             
             headers = {
-                'User-Agent': self.ua.random,
+                'User-Agent': random.choice(self.user_agents),
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             }
             
-            response = self.session.get(search_url, headers=headers, timeout=30)
+            async with self._host_slot(search_url):
+                async with self.session.stream("GET", search_url, headers=headers) as response:
+                    content = await self._read_page(response) if response.status_code == 200 else None
             
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
+            if content is not None:
                 # Buscar elementos de trabajo (ajustar selectores según BNE actual)
-                job_elements = soup.find_all('div', class_=['trabajo', 'empleo-item'])
-                
-                for element in job_elements[:self.daily_limits[JobPortal.BNE]]:
+                for card in extract_cards(content, BNE_CARDS, self.daily_limits[JobPortal.BNE]):
                     try:
-                        title_elem = element.find('h3') or element.find('a', class_='titulo')
-                        company_elem = element.find(class_='empresa')
-                        
-                        if not title_elem:
+                        if not card["title"]:
                             continue
                         
-                        job = JobPosting(
+                        job_url = card_url(BNE_BASE_URL, card["href"])
+                        company = card["company"] or PLACEHOLDER_COMPANY[JobPortal.BNE]
+                        
+                        job = JobPosting.model_construct(
                             portal=JobPortal.BNE,
-                            external_id=str(random.randint(10000, 99999)),
-                            url=search_url,
-                            title=title_elem.get_text(strip=True),
-                            company=company_elem.get_text(strip=True) if company_elem else "Empleador BNE",
+                            external_id=derived_external_id(JobPortal.BNE, job_url, card["title"], company),
+                            url=job_url or search_url,
+                            title=card["title"],
+                            company=company,
                             location="Chile",
                             description="",
                             requirements=[],
-                            keywords_matched=self._find_matching_keywords(title_elem.get_text(), filters.keywords)
+                            keywords_matched=self._find_matching_keywords(card["title"], filters)
                         )
                         
                         jobs.append(job)
@@ -264,8 +461,6 @@ class ScraperService:
                         logger.warning(f"Error procesando trabajo BNE: {e}")
                         continue
             
-            await self._human_delay(3, 8)
-        
         except Exception as e:
             logger.error(f"Error general BNE: {e}")
         
@@ -283,36 +478,34 @@ class ScraperService:
             search_url = f"https://cl.trabajando.com/trabajo-empleo-de-{keywords}"
             
             headers = {
-                'User-Agent': self.ua.random,
+                'User-Agent': random.choice(self.user_agents),
                 'Referer': 'https://cl.trabajando.com/'
             }
             
-            response = self.session.get(search_url, headers=headers, timeout=30)
+            async with self._host_slot(search_url):
+                async with self.session.stream("GET", search_url, headers=headers) as response:
+                    content = await self._read_page(response) if response.status_code == 200 else None
             
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
+            if content is not None:
                 # Selectores específicos para trabajando.com
-                job_cards = soup.find_all('div', class_=['oferta', 'trabajo-card'])
-                
-                for card in job_cards[:self.daily_limits[JobPortal.TRABAJANDO]]:
+                for card in extract_cards(content, TRABAJANDO_CARDS, self.daily_limits[JobPortal.TRABAJANDO]):
                     try:
-                        title_elem = card.find('h2') or card.find(class_='titulo-oferta')
-                        company_elem = card.find(class_=['nombre-empresa', 'company'])
-                        
-                        if not title_elem:
+                        if not card["title"]:
                             continue
                         
-                        job = JobPosting(
+                        job_url = card_url(TRABAJANDO_BASE_URL, card["href"])
+                        company = card["company"] or PLACEHOLDER_COMPANY[JobPortal.TRABAJANDO]
+                        
+                        job = JobPosting.model_construct(
                             portal=JobPortal.TRABAJANDO,
-                            external_id=str(random.randint(20000, 99999)),
-                            url=search_url,
-                            title=title_elem.get_text(strip=True),
-                            company=company_elem.get_text(strip=True) if company_elem else "Empresa",
+                            external_id=derived_external_id(JobPortal.TRABAJANDO, job_url, card["title"], company),
+                            url=job_url or search_url,
+                            title=card["title"],
+                            company=company,
                             location="Santiago, Chile",
                             description="",
                             requirements=[],
-                            keywords_matched=self._find_matching_keywords(title_elem.get_text(), filters.keywords)
+                            keywords_matched=self._find_matching_keywords(card["title"], filters)
                         )
                         
                         jobs.append(job)
@@ -321,35 +514,70 @@ class ScraperService:
                         logger.warning(f"Error procesando trabajo Trabajando.com: {e}")
                         continue
             
-            await self._human_delay(3, 8)
-            
         except Exception as e:
             logger.error(f"Error general Trabajando.com: {e}")
         
         return jobs
     
-    def _find_matching_keywords(self, text: str, keywords: List[str]) -> List[str]:
+    def _find_matching_keywords(self, text: str, filters: SearchFilters) -> List[str]:
         """Encontrar keywords que coinciden en el texto"""
-        text_lower = text.lower()
-        matched = []
-        
-        for keyword in keywords:
-            if keyword.lower() in text_lower:
-                matched.append(keyword)
-        
-        return matched
+        return get_matcher(filters).find(text)
     
     async def search_and_apply(self, user_id: str):
         """Proceso completo de búsqueda y postulación para un usuario"""
         try:
             logger.info(f"Iniciando búsqueda automática para usuario {user_id}")
             
-            # TODO: Obtener filtros de usuario desde DB
-            # TODO: Buscar trabajos
-            # TODO: Filtrar trabajos ya postulados
+            # Filtros y trabajos ya postulados en paralelo (una sola espera a Mongo)
+            filters, applied = await asyncio.gather(
+                self._get_active_filters(user_id),
+                self._get_applied_jobs(user_id)
+            )
+            if filters is None:
+                logger.info(f"Usuario {user_id} sin filtros activos")
+                return
+            
+            jobs = [
+                job for job in await self.search_jobs(filters)
+                if (job.portal.value, job.external_id) not in applied
+            ]
+            saved = await self.save_jobs(jobs)
+            logger.info(f"{len(jobs)} trabajos nuevos para usuario {user_id} ({saved} guardados por primera vez)")
+            
             # TODO: Aplicar automáticamente con límites de velocidad
             
             logger.info(f"Búsqueda completada para usuario {user_id}")
             
         except Exception as e:
-            logger.error(f"Error en búsqueda automática para usuario {user_id}: {e}")
\ No newline at end of file
+            logger.error(f"Error en búsqueda automática para usuario {user_id}: {e}")
+    
+    async def save_jobs(self, jobs: List[JobPosting]) -> int:
+        """Guardar trabajos scrapeados en lote, ignorando los ya existentes"""
+        if not jobs:
+            return 0
+        
+        operations = [
+            UpdateOne(
+                {"portal": job.portal, "external_id": job.external_id},
+                {"$setOnInsert": job.model_dump()},
+                upsert=True
+            )
+            for job in jobs
+        ]
+        result = await self.db.jobs.bulk_write(operations, ordered=False)
+        return result.upserted_count
+    
+    async def _get_active_filters(self, user_id: str) -> Optional[SearchFilters]:
+        """Filtros de búsqueda activos del usuario, si tiene"""
+        doc = await self.db.search_filters.find_one({"user_id": user_id, "is_active": True}, {"_id": 0})
+        return SearchFilters.model_validate(doc) if doc else None
+    
+    async def _get_applied_jobs(self, user_id: str) -> set:
+        """(portal, external_id) de los trabajos a los que el usuario ya postuló"""
+        # Dos consultas por índice (applications.user_id, jobs.id) en vez de un $lookup por postulación
+        job_ids = await self.db.applications.distinct("job_id", {"user_id": user_id})
+        if not job_ids:
+            return set()
+        
+        cursor = self.db.jobs.find({"id": {"$in": job_ids}}, {"_id": 0, "portal": 1, "external_id": 1})
+        return {(doc["portal"], doc["external_id"]) async for doc in cursor}
@@ -0,0 +1,210 @@
+import os
+import re
+import time
+import zlib
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import orjson
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.cache_service import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class SemanticCache:
+    """Caché de respuestas LLM por similitud de texto.
+
+    Cada entrada pertenece a un namespace exacto (tipo de prompt, usuario, CV,
+    empresa) y dentro de él se reutiliza la respuesta de un prompt cuyo texto
+    clave tenga similitud coseno >= threshold. Los embeddings son vectores de
+    unigramas y bigramas con hashing, normalizados, y la búsqueda es un
+    producto punto sobre la matriz del namespace. Las entradas se guardan en
+    Mongo (colección llm_cache) con expiración por TTL.
+
+    Las entradas existentes al arrancar forman una matriz base de solo lectura;
+    con snapshot_dir se guarda en disco y los workers la abren con mmap, de modo
+    que comparten una sola copia en memoria. Las entradas nuevas del worker se
+    agregan a matrices delta por namespace, acotadas: a lo más max_delta_rows
+    filas por namespace y max_delta_namespaces namespaces (LRU), y las filas
+    dejan de usarse al cumplir el mismo TTL que en Mongo.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        dim: int = 1024,
+        threshold: float = 0.92,
+        ttl_seconds: int = 7 * 24 * 3600,
+        snapshot_dir: Optional[str] = None,
+        snapshot_max_age: int = 600,
+        max_delta_rows: int = 256,
+        max_delta_namespaces: int = 4096
+    ):
+        self.collection = db.llm_cache
+        self.dim = dim
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self.snapshot_max_age = snapshot_max_age
+        # Matriz base (en memoria o mmap) con filas contiguas por namespace
+        self._base = np.zeros((0, dim), dtype=np.float32)
+        self._base_rows: Dict[str, Tuple[int, int]] = {}
+        self._base_responses: List[str] = []
+        # Entradas agregadas por este worker: namespace -> (matriz, respuestas, creación)
+        self.max_delta_rows = max_delta_rows
+        self._delta = TTLCache(maxsize=max_delta_namespaces, ttl=ttl_seconds)
+
+    async def load(self):
+        """Crear índices y cargar las entradas vigentes"""
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+        await self.collection.create_index("namespace")
+
+        if self.snapshot_dir is not None and self._open_snapshot():
+            logger.info(f"Caché semántica abierta desde snapshot con {len(self._base_responses)} entradas")
+            return
+
+        vectors, responses, rows = [], [], {}
+        cursor = self.collection.find({}, {"_id": 0, "namespace": 1, "key_text": 1, "response": 1}).sort("namespace", 1)
+        async for doc in cursor:
+            start, _ = rows.get(doc["namespace"], (len(responses), 0))
+            vectors.append(self.embed(doc["key_text"]))
+            responses.append(doc["response"])
+            rows[doc["namespace"]] = (start, len(responses))
+
+        self._base = np.vstack(vectors) if vectors else np.zeros((0, self.dim), dtype=np.float32)
+        self._base_rows = rows
+        self._base_responses = responses
+
+        if self.snapshot_dir is not None:
+            self._write_snapshot()
+            self._open_snapshot()
+
+        logger.info(f"Caché semántica cargada con {len(responses)} entradas")
+
+    def _write_snapshot(self):
+        """Guardar la matriz base en disco (reemplazo atómico)"""
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        vectors_tmp = self.snapshot_dir / f"vectors.{os.getpid()}.npy"
+        index_tmp = self.snapshot_dir / f"index.{os.getpid()}.json"
+
+        np.save(vectors_tmp, self._base)
+        index_tmp.write_bytes(orjson.dumps({
+            "dim": self.dim,
+            "count": len(self._base_responses),
+            "rows": self._base_rows,
+            "responses": self._base_responses
+        }))
+        os.replace(vectors_tmp, self.snapshot_dir / "vectors.npy")
+        os.replace(index_tmp, self.snapshot_dir / "index.json")
+
+    def _open_snapshot(self) -> bool:
+        """Abrir el snapshot con mmap si existe, es reciente y está completo"""
+        vectors_path = self.snapshot_dir / "vectors.npy"
+        index_path = self.snapshot_dir / "index.json"
+        try:
+            if time.time() - index_path.stat().st_mtime > self.snapshot_max_age:
+                return False
+
+            index = orjson.loads(index_path.read_bytes())
+            base = np.load(vectors_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return False
+
+        # Otro worker pudo reemplazar solo uno de los dos archivos
+        if index["dim"] != self.dim or base.shape[0] != index["count"]:
+            return False
+
+        self._base = base
+        self._base_rows = {namespace: tuple(span) for namespace, span in index["rows"].items()}
+        self._base_responses = index["responses"]
+        return True
+
+    def embed(self, text: str) -> np.ndarray:
+        """Vector normalizado de unigramas y bigramas (feature hashing)"""
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            h = zlib.crc32(feature.encode())
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, namespace: str, vector: np.ndarray, threshold: Optional[float] = None) -> Optional[str]:
+        """Respuesta más similar del namespace si supera el umbral"""
+        if not vector.any():
+            return None
+
+        best_score, best_response = -1.0, None
+        span = self._base_rows.get(namespace)
+        if span is not None:
+            start, end = span
+            scores = self._base[start:end] @ vector
+            best = int(np.argmax(scores))
+            best_score, best_response = scores[best], self._base_responses[start + best]
+
+        delta = self._delta.get(namespace)
+        if delta is not None:
+            matrix, responses, created = delta
+            scores = matrix @ vector
+            scores[created < time.monotonic() - self.ttl_seconds] = -1.0  # Ya expiradas en Mongo
+            best = int(np.argmax(scores))
+            if scores[best] > best_score:
+                best_score, best_response = scores[best], responses[best]
+
+        if best_response is not None and best_score >= (self.threshold if threshold is None else threshold):
+            return best_response
+        return None
+
+    async def put(self, namespace: str, key_text: str, response: str, vector: Optional[np.ndarray] = None):
+        """Guardar respuesta en memoria y en Mongo"""
+        self._add(namespace, self.embed(key_text) if vector is None else vector, response)
+        await self.collection.insert_one({
+            "namespace": namespace,
+            "key_text": key_text,
+            "response": response,
+            "created_at": datetime.utcnow()
+        })
+
+    async def get_or_compute(
+        self,
+        namespace: str,
+        key_text: str,
+        compute: Callable[[], Awaitable[str]],
+        threshold: Optional[float] = None
+    ) -> Tuple[str, bool]:
+        """Devolver (respuesta, hit); en caso de miss se calcula y se guarda"""
+        vector = self.embed(key_text)
+        cached = self.lookup(namespace, vector, threshold)
+        if cached is not None:
+            return cached, True
+
+        response = await compute()
+        try:
+            await self.put(namespace, key_text, response, vector)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar en caché semántica: {e}")
+        return response, False
+
+    def _add(self, namespace: str, vector: np.ndarray, response: str):
+        now = time.monotonic()
+        row = vector.reshape(1, -1)
+        delta = self._delta.get(namespace)
+        if delta is None:
+            matrix, responses, created = row, [response], np.array([now])
+        else:
+            matrix, responses, created = delta
+            # Descartar las filas expiradas y, si se supera el máximo, las más antiguas
+            keep = np.flatnonzero(created >= now - self.ttl_seconds)
+            keep = keep[max(len(keep) - self.max_delta_rows + 1, 0):]
+            matrix = np.vstack([matrix[keep], row])
+            responses = [responses[i] for i in keep] + [response]
+            created = np.append(created[keep], now)
+        self._delta.set(namespace, (matrix, responses, created))
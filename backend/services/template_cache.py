@@ -0,0 +1,63 @@
+import hashlib
+import logging
+from typing import Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.cache_service import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateCache:
+    """Caché de respuestas por plantilla de prompt y entidades invariantes.
+
+    La clave es el namespace del prompt (plantilla, usuario, CV, estilo) más el
+    texto exacto de cada slot (empresa y cargo). La respuesta se reutiliza tal
+    cual: reemplazar texto dentro de lo generado por el LLM puede alterar datos
+    del CV, así que cualquier cambio en un slot es un miss.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, maxsize: int = 2048, ttl_seconds: int = 30 * 24 * 3600):
+        self.collection = db.gencache
+        self.ttl_seconds = ttl_seconds
+        self._memory = TTLCache(maxsize=maxsize, ttl=3600)
+
+    async def load(self):
+        """Crear índice de expiración (las entradas sin uso reciente se eliminan)"""
+        await self.collection.create_index("last_used", expireAfterSeconds=self.ttl_seconds)
+
+    @staticmethod
+    def _key(namespace: str, slots: Dict[str, str]) -> str:
+        raw = "|".join([namespace, *(f"{name}={slots[name]}" for name in sorted(slots))])
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    async def get(self, namespace: str, slots: Dict[str, str]) -> Optional[str]:
+        """Respuesta guardada para exactamente estos slots, o None si no hay entrada"""
+        key = self._key(namespace, slots)
+        response = self._memory.get(key)
+
+        if response is None:
+            doc = await self.collection.find_one_and_update(
+                {"_id": key},
+                {"$currentDate": {"last_used": True}},
+                projection={"response": 1}
+            )
+            if not doc:
+                return None
+            response = doc["response"]
+            self._memory.set(key, response)
+
+        return response
+
+    async def put(self, namespace: str, slots: Dict[str, str], response: str):
+        """Guardar respuesta para la plantilla y sus entidades"""
+        key = self._key(namespace, slots)
+        self._memory.set(key, response)
+
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {"response": response, "slots": slots}, "$currentDate": {"last_used": True}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"No se pudo guardar en caché de plantillas: {e}")
@@ -0,0 +1,164 @@
+import asyncio
+import re
+
+from models import CVData, JobPosting, JobPortal
+from services.ai_service import AIService
+from services.semantic_cache import SemanticCache
+from services.template_cache import TemplateCache
+
+
+class FakeCollection:
+    """Colección mínima en memoria para las cachés (insert, upsert por _id y lectura)"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_one(self, doc):
+        self.docs[len(self.docs)] = doc
+
+    async def update_one(self, query, update, upsert=False):
+        self.docs[query["_id"]] = dict(update["$set"])
+
+    async def find_one_and_update(self, query, update, projection=None):
+        return self.docs.get(query["_id"])
+
+
+class FakeDB:
+    def __init__(self):
+        self.llm_cache = FakeCollection()
+        self.gencache = FakeCollection()
+
+
+class EchoChat:
+    """Responde con el cargo del prompt y cuenta las llamadas"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def send_message(self, message):
+        self.calls += 1
+        title = re.search(r"Cargo: (.+)", message.text).group(1)
+        return f"Carta para el cargo de {title}"
+
+
+def make_service(chat):
+    db = FakeDB()
+    service = AIService(cache=SemanticCache(db), template_cache=TemplateCache(db))
+
+    async def get_chat(user_id):
+        return chat
+
+    service._get_chat = get_chat
+    return service
+
+
+def make_cv():
+    return CVData(
+        user_id="u1", title="CV", filename="cv.pdf", raw_text="cv", personal_info={"name": "Ana"},
+        experience=[], education=[], skills=["Ventas"], certifications=[], languages=[]
+    )
+
+
+DESCRIPTION = (
+    "Buscamos profesional para el área comercial a cargo de la cartera de clientes empresa en la "
+    "Región Metropolitana, con foco en prospección, negociación y cierre de ventas, seguimiento de "
+    "metas mensuales, coordinación con operaciones y reportes semanales a la gerencia comercial. "
+    "Ofrecemos renta fija más variable, seguro complementario y modalidad híbrida."
+)
+
+
+def make_job(title, company="Banco Uno"):
+    return JobPosting(
+        portal=JobPortal.LABORUM, external_id=title, url="https://example.com", title=title,
+        company=company, location="Santiago", description=DESCRIPTION, requirements=["CRM", "Excel avanzado"]
+    )
+
+
+def test_cover_letters_differ_by_title():
+    chat = EchoChat()
+    service = make_service(chat)
+    cv = make_cv()
+    # Las claves son casi idénticas: sin el cargo en el namespace la caché semántica reutilizaría la carta
+    key = service._cover_letter_key
+    similarity = service.cache.embed(key(make_job("Ejecutivo Comercial Senior"))) @ service.cache.embed(
+        key(make_job("Ejecutivo Comercial Junior"))
+    )
+    assert similarity >= service.cache.threshold
+
+    async def run():
+        senior = await service.generate_cover_letter("u1", cv, make_job("Ejecutivo Comercial Senior"))
+        junior = await service.generate_cover_letter("u1", cv, make_job("Ejecutivo Comercial Junior"))
+        return senior, junior
+
+    senior, junior = asyncio.run(run())
+    assert senior == "Carta para el cargo de Ejecutivo Comercial Senior"
+    assert junior == "Carta para el cargo de Ejecutivo Comercial Junior"
+    assert chat.calls == 2
+
+
+def test_cover_letter_reused_for_same_offer():
+    chat = EchoChat()
+    service = make_service(chat)
+    cv = make_cv()
+
+    async def run():
+        first = await service.generate_cover_letter("u1", cv, make_job("Jefe de Ventas"))
+        again = await service.generate_cover_letter("u1", cv, make_job("Jefe de Ventas"))
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert first == again
+    assert chat.calls == 1
+
+
+def test_semantic_cache_hit_within_namespace_only():
+    cache = SemanticCache(FakeDB())
+    asyncio.run(cache.put("ns-a", "desarrollador python backend con django", "respuesta a"))
+
+    assert cache.lookup("ns-a", cache.embed("desarrollador python backend con django")) == "respuesta a"
+    assert cache.lookup("ns-b", cache.embed("desarrollador python backend con django")) is None
+    assert cache.lookup("ns-a", cache.embed("contador auditor con experiencia en impuestos")) is None
+
+
+def test_template_cache_requires_exact_slots():
+    cache = TemplateCache(FakeDB())
+    slots = {"company": "Banco de Chile", "title": "Analista"}
+
+    async def run():
+        await cache.put("ns", slots, "Estudié en la Universidad de Chile")
+        cache._memory.clear()
+        return (
+            await cache.get("ns", slots),
+            await cache.get("ns", {"company": "Banco de Chile", "title": "Analista Senior"}),
+        )
+
+    hit, miss = asyncio.run(run())
+    assert hit == "Estudié en la Universidad de Chile"
+    assert miss is None
+
+
+def test_semantic_cache_delta_is_bounded_per_namespace_and_by_namespaces():
+    cache = SemanticCache(FakeDB(), max_delta_rows=3, max_delta_namespaces=2)
+    for i in range(5):
+        cache._add("ns-a", cache.embed(f"oferta numero {i} desarrollador"), f"respuesta {i}")
+
+    matrix, responses, _ = cache._delta.get("ns-a")
+    assert matrix.shape[0] == 3
+    assert responses == ["respuesta 2", "respuesta 3", "respuesta 4"]
+    assert cache.lookup("ns-a", cache.embed("oferta numero 0 desarrollador"), threshold=0.999) is None
+
+    cache._add("ns-b", cache.embed("contador"), "b")
+    cache._add("ns-c", cache.embed("vendedor"), "c")
+    assert cache.lookup("ns-a", cache.embed("oferta numero 4 desarrollador")) is None
+    assert cache.lookup("ns-c", cache.embed("vendedor")) == "c"
+
+
+def test_semantic_cache_delta_rows_expire_with_ttl():
+    cache = SemanticCache(FakeDB(), ttl_seconds=60)
+    cache._add("ns", cache.embed("desarrollador python"), "vieja")
+    matrix, responses, created = cache._delta.get("ns")
+    created -= 61  # Simular una fila creada hace más que el TTL
+
+    assert cache.lookup("ns", cache.embed("desarrollador python")) is None
+    cache._add("ns", cache.embed("desarrollador python"), "nueva")
+    assert cache._delta.get("ns")[1] == ["nueva"]
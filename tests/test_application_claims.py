@@ -0,0 +1,138 @@
+import asyncio
+import copy
+from datetime import datetime, timedelta, timezone
+
+from models import ApplicationStatus, CVData, JobApplication, JobPosting, JobPortal
+from services.application_service import ApplicationService, CLAIM_TIMEOUT
+
+
+class FakeApplications:
+    """Colección applications en memoria con las operaciones que usa ApplicationService"""
+
+    def __init__(self, docs):
+        self.docs = {doc["id"]: doc for doc in docs}
+        self.job = None
+        self.cv = None
+        self.bulk_writes = 0
+
+    async def find_one_and_update(self, query, update, projection=None):
+        doc = self.docs.get(query["id"])
+        if doc is None or doc["status"] != query["status"]:
+            return None
+        claimed_at = doc.get("claimed_at")
+        expired = query["$or"][1]["claimed_at"]["$lt"]
+        if claimed_at is not None and claimed_at >= expired:
+            return None
+        doc.update(update["$set"])
+        return {"_id": doc["id"]}
+
+    async def update_one(self, query, update):
+        self.docs[query["id"]].update(update["$set"])
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes += 1
+        for operation in operations:
+            self.docs[operation._filter["id"]].update(operation._doc["$set"])
+
+    def aggregate(self, pipeline):
+        application_id = pipeline[0]["$match"]["id"]
+        doc = dict(copy.deepcopy(self.docs[application_id]), job=self.job, cv=self.cv)
+        outer = self
+
+        class Cursor:
+            async def to_list(self, length):
+                return [doc] if application_id in outer.docs else []
+
+        return Cursor()
+
+
+class FakeDB:
+    def __init__(self, applications):
+        self.applications = applications
+
+
+class FakeAI:
+    async def personalize_cv(self, user_id, cv, job):
+        return "CV personalizado"
+
+    async def analyze_job_compatibility(self, user_id, cv, job):
+        return {"compatibility_score": 80}
+
+    async def generate_cover_letter(self, user_id, cv, job):
+        return "Carta"
+
+
+def make_service(applications):
+    job = JobPosting(
+        portal=JobPortal.BNE, external_id="1", url="https://www.bne.cl/oferta/1",
+        title="Vendedor", company="Acme", location="Chile", description=""
+    )
+    cv = CVData(
+        user_id="u1", title="CV", filename="cv.pdf", raw_text="cv", personal_info={},
+        experience=[], education=[], skills=[], certifications=[], languages=[]
+    )
+    applications.job = job.model_dump()
+    applications.cv = cv.model_dump()
+
+    service = ApplicationService(FakeDB(applications), ai_service=FakeAI())
+    submitted = []
+
+    async def submit(application, job, cv):
+        submitted.append(application.id)
+        return True
+
+    service._portal_handlers[JobPortal.BNE.value] = submit
+    return service, submitted
+
+
+def make_application(**fields):
+    return JobApplication(user_id="u1", job_id="j1", portal=JobPortal.BNE, cv_used="cv1", **fields).model_dump()
+
+
+def test_application_is_submitted_once():
+    application = make_application()
+    applications = FakeApplications([application])
+    service, submitted = make_service(applications)
+
+    async def run():
+        await asyncio.gather(
+            service.process_application(application["id"]),
+            service.process_batch([application["id"]])
+        )
+        await service.process_application(application["id"])
+
+    asyncio.run(run())
+    assert submitted == [application["id"]]
+    assert applications.docs[application["id"]]["status"] == ApplicationStatus.APPLIED.value
+
+
+def test_recent_claim_is_skipped_and_expired_claim_is_retried():
+    now = datetime.now(timezone.utc)
+    in_progress = make_application(claimed_at=now - timedelta(minutes=1))
+    abandoned = make_application(claimed_at=now - CLAIM_TIMEOUT - timedelta(minutes=1))
+    service, submitted = make_service(FakeApplications([in_progress, abandoned]))
+
+    asyncio.run(service.process_batch([in_progress["id"], abandoned["id"]]))
+    assert submitted == [abandoned["id"]]
+
+
+def test_batch_writes_status_before_flushing_generated_data():
+    application = make_application()
+    applications = FakeApplications([application])
+    service, _ = make_service(applications)
+    states = []
+
+    original_bulk_write = applications.bulk_write
+
+    async def bulk_write(operations, ordered=True):
+        # Al escribir el lote el estado ya debe estar guardado
+        states.append(applications.docs[application["id"]]["status"])
+        await original_bulk_write(operations, ordered)
+
+    applications.bulk_write = bulk_write
+    asyncio.run(service.process_batch([application["id"]]))
+
+    doc = applications.docs[application["id"]]
+    assert states == [ApplicationStatus.APPLIED.value]
+    assert doc["cover_letter"] == "Carta"
+    assert doc["match_analysis"] == {"compatibility_score": 80}
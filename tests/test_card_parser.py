@@ -0,0 +1,32 @@
+from services import card_parser
+from services.card_parser import CardSpec
+
+SPEC = CardSpec(['job-item', 'job-card'], {
+    "title": ("h3", "a.job-title"),
+    "company": (".company-name, .empresa",)
+})
+
+PAGE = """
+<html><body><main>
+  <div class="job-card destacada"><h3><a href="/oferta/1">Dev Python</a></h3><span class="empresa">Acme</span></div>
+  <div class="job-item"><a class="job-title" href="/oferta/2">QA</a></div>
+  <div class="sidebar"><h3>No es oferta</h3></div>
+  <div class="job-card"><h3><a href="/oferta/3">Data Engineer</a></h3><p class="company-name">Beta</p></div>
+</main></body></html>
+""".encode()
+
+EXPECTED = [
+    {"title": "Dev Python", "company": "Acme", "href": "/oferta/1"},
+    {"title": "QA", "company": None, "href": "/oferta/2"},
+    {"title": "Data Engineer", "company": "Beta", "href": "/oferta/3"},
+]
+
+
+def test_selectolax_and_soup_agree_in_document_order():
+    assert card_parser._extract_selectolax(PAGE, SPEC, 10) == EXPECTED
+    assert card_parser._extract_soup(PAGE, SPEC, 10) == EXPECTED
+
+
+def test_limit_keeps_the_same_cards_on_both_paths():
+    assert card_parser._extract_selectolax(PAGE, SPEC, 2) == EXPECTED[:2]
+    assert card_parser._extract_soup(PAGE, SPEC, 2) == EXPECTED[:2]
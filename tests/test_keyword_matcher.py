@@ -0,0 +1,49 @@
+import pytest
+
+from models import SearchFilters
+from services import keyword_matcher
+from services.keyword_matcher import KeywordMatcher, get_matcher
+
+KEYWORDS = ("Python", "Java", "JavaScript", "React", "react native", "SQL", "nosql")
+TEXTS = [
+    "Desarrollador JavaScript y React Native con NoSQL",
+    "Ingeniero PYTHON / SQL Server",
+    "Analista de datos",
+    "",
+]
+
+
+def naive(keywords, text):
+    return [keyword for keyword in keywords if keyword.lower() in text.lower()]
+
+
+@pytest.fixture(params=["ahocorasick", "regex"])
+def matcher_backend(request, monkeypatch):
+    if request.param == "ahocorasick":
+        pytest.importorskip("ahocorasick")
+    else:
+        monkeypatch.setattr(keyword_matcher, "ahocorasick", None)
+    return request.param
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_matches_naive_containment(matcher_backend, text):
+    assert KeywordMatcher(KEYWORDS).find(text) == naive(KEYWORDS, text)
+
+
+def test_overlapping_keywords_are_all_found(matcher_backend):
+    # "java" está dentro de "javascript" y "sql" dentro de "nosql"
+    found = KeywordMatcher(KEYWORDS).find("Buscamos JavaScript y NoSQL")
+    assert found == ["Java", "JavaScript", "SQL", "nosql"]
+
+
+def test_empty_keywords_match_nothing(matcher_backend):
+    assert KeywordMatcher(()).find("Python") == []
+
+
+def test_matcher_is_rebuilt_when_keywords_change():
+    filters = SearchFilters(user_id="u1", keywords=["Python"])
+    assert get_matcher(filters).find("Python y Go") == ["Python"]
+
+    filters.keywords = ["Go"]
+    assert get_matcher(filters).find("Python y Go") == ["Go"]
@@ -0,0 +1,53 @@
+from models import JobPosting, JobPortal
+from services.scraper_service import (
+    PLACEHOLDER_COMPANY, card_url, BNE_BASE_URL, dedupe_jobs, derived_external_id, has_native_id
+)
+
+
+def make_job(portal, external_id, title, company):
+    return JobPosting(
+        portal=portal, external_id=external_id, url="https://example.com", title=title,
+        company=company, location="Santiago", description=""
+    )
+
+
+def derived_job(portal, title, company, href=None):
+    url = card_url(BNE_BASE_URL, href)
+    return make_job(portal, derived_external_id(portal, url, title, company), title, company)
+
+
+def test_native_ids_keep_same_title_postings():
+    jobs, added = dedupe_jobs([(JobPortal.LINKEDIN, [
+        make_job(JobPortal.LINKEDIN, "101", "Desarrollador Python", "Acme"),
+        make_job(JobPortal.LINKEDIN, "102", "Desarrollador Python", "Acme"),
+        make_job(JobPortal.LINKEDIN, "101", "Desarrollador Python", "Acme"),
+    ])])
+    assert [job.external_id for job in jobs] == ["101", "102"]
+    assert added == {JobPortal.LINKEDIN: 2}
+
+
+def test_derived_ids_fall_back_to_company_and_title_across_portals():
+    trabajando = derived_job(JobPortal.TRABAJANDO, "Analista Contable", "Acme")
+    laborum = make_job(JobPortal.LABORUM, "987654", "Analista Contable", "ACME")
+
+    # Aunque Trabajando.com venga primero, se conserva la oferta con ID propio
+    jobs, added = dedupe_jobs([(JobPortal.TRABAJANDO, [trabajando]), (JobPortal.LABORUM, [laborum])])
+    assert jobs == [laborum]
+    assert added == {JobPortal.TRABAJANDO: 0, JobPortal.LABORUM: 1}
+
+
+def test_placeholder_company_does_not_merge_postings():
+    company = PLACEHOLDER_COMPANY[JobPortal.BNE]
+    first = derived_job(JobPortal.BNE, "Vendedor", company, href="/oferta/1")
+    second = derived_job(JobPortal.BNE, "Vendedor", company, href="/oferta/2")
+
+    jobs, _ = dedupe_jobs([(JobPortal.BNE, [first, second])])
+    assert jobs == [first, second]
+
+
+def test_derived_id_ignores_search_and_tracks_the_posting():
+    url = card_url(BNE_BASE_URL, "/oferta/1")
+    assert url == "https://www.bne.cl/oferta/1"
+    assert derived_external_id(JobPortal.BNE, url, "Vendedor", "Acme") == derived_external_id(JobPortal.BNE, url, "Otro", "X")
+    assert derived_external_id(JobPortal.BNE, "", "Vendedor", "Acme") != derived_external_id(JobPortal.TRABAJANDO, "", "Vendedor", "Acme")
+    assert not has_native_id(derived_job(JobPortal.BNE, "Vendedor", "Acme"))